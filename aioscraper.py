@@ -0,0 +1,80 @@
+# External imports
+import asyncio
+import pytz
+
+# Internal imports
+from scheduler import PollScheduler
+from scraper import Scraper
+from soup import Soup
+
+class AsyncScraper(Scraper):
+    # Scrape loop that overlaps the odds query, the scores page snapshot and
+    # the dumps of the previous iteration on an asyncio event loop.
+    #
+    # Game states are only updated by iterate(), on the event loop thread, once
+    # the previous iteration's writes have finished. Transitions happen in the
+    # same order, and the same rows are dumped, as with scrape().
+
+    # Seconds the odds query may run past the page snapshot before the
+    # iteration goes ahead with the previous lines.
+    lines_deadline = 30
+
+    async def run(self):
+        tz = pytz.timezone('US/Pacific')
+        webpage = self.webpage if self.webpage else await asyncio.to_thread(Soup)
+        lines = {}
+        lines_task = None
+        write_task = None
+        wait_time = 0
+        try:
+            while True:
+                self.logger.log(f"---> {self.clock.now(tz).strftime('%m/%d/%Y')} {self.clock.now(tz).strftime('%H:%M:%S')}")
+
+                # Time the soup was brewed and lines were generated.
+                timestamp = self.clock.now(tz)
+
+                # Start the odds query, unless the last one is still running.
+                if lines_task is None:
+                    lines_task = asyncio.ensure_future(asyncio.to_thread(self.linegen.get_lines,
+                                                                    self.live_prefixes()))
+
+                # Snapshot the page while the query and the last writes run.
+                # Reload the webpage after a long sleep first.
+                if wait_time > PollScheduler.reload_after:
+                    records = await asyncio.to_thread(self.reload_and_brew, webpage)
+                else:
+                    records = await asyncio.to_thread(webpage.brew, True)
+                if write_task:
+                    await write_task
+                    write_task = None
+
+                # Wait for the odds query, up to the deadline.
+                done, _ = await asyncio.wait({lines_task}, timeout=AsyncScraper.lines_deadline)
+                if done:
+                    lines = lines_task.result()
+                    lines_task = None
+                else:
+                    self.logger.log('Odds query past its deadline, using the previous lines.')
+
+                # Process the game soups, then dump in the background.
+                writes = self.iterate(timestamp, lines, records)
+                write_task = asyncio.ensure_future(asyncio.to_thread(self.write, writes))
+
+                # Print browser session statistics
+                self.logger.log('Browser: ' + str(webpage.metrics()))
+                # Print write pipeline statistics
+                self.logger.log('Dumper: ' + str(self.dumper.metrics()))
+
+                # Sleep until the iteration deadline.
+                wait_time = self.wait_time(lines)
+                elapsed = (self.clock.now(tz) - timestamp).total_seconds()
+                await self.clock.sleep_async(max(wait_time - elapsed, 0))
+        finally:
+            # Flush the last iteration's writes on shutdown.
+            if write_task:
+                await write_task
+
+    # Reloads the webpage, see Soup.reload(), then brews it.
+    def reload_and_brew(self, webpage):
+        webpage.reload()
+        return webpage.brew(parsed=True)
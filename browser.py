@@ -0,0 +1,231 @@
+# External imports
+import os
+import threading
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+
+class BrowserSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.launched = time.monotonic()
+        # Set when the session becomes the active one.
+        self.activated = self.launched
+
+    # Seconds the session has been active.
+    # A standby is idle until it's swapped in, so its age starts then.
+    def age(self):
+        return time.monotonic() - self.activated
+
+    # Resident memory of the chromedriver process and every browser process
+    # under it, in bytes. None if it can't be read (non-Linux hosts).
+    def rss(self):
+        try:
+            pids = [self.driver.service.process.pid]
+            total = 0
+            while pids:
+                pid = pids.pop()
+                with open(f'/proc/{pid}/status') as file:
+                    for line in file:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+                            break
+                for tid in os.listdir(f'/proc/{pid}/task'):
+                    with open(f'/proc/{pid}/task/{tid}/children') as file:
+                        pids.extend(int(child) for child in file.read().split())
+            return total
+        except Exception:
+            return None
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(e)
+
+
+class BrowserManager:
+    # Manages the lifecycle of the headless Chrome sessions used by Soup.
+    #
+    # The chromedriver binary is resolved once per process. A warm standby
+    # session is launched in the background so a failed session can be swapped
+    # out without a cold start, and sessions are recycled once they exceed an
+    # age or memory threshold.
+
+    # Resolved chromedriver path, shared by every manager.
+    driver_path = None
+
+    # Lean profile url patterns that are never loaded.
+    # SoupParser only reads the page's html, so images, fonts, video and
+    # ad/analytics scripts are dead weight.
+    lean_blocked = [
+        # Images (the base runner diamond is inline svg, not a file)
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.ico', '*.svg',
+        # Fonts
+        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+        # Video
+        '*.mp4', '*.webm', '*.m3u8', '*.mpd',
+        # Ads and analytics
+        '*doubleclick.net*', '*googlesyndication.com*', '*googletagmanager.com*',
+        '*google-analytics.com*', '*googletagservices.com*', '*amazon-adsystem.com*',
+        '*adsafeprotected.com*', '*scorecardresearch.com*', '*facebook.net*',
+        '*omtrdc.net*', '*demdex.net*', '*optimizely.com*', '*branch.io*',
+        '*imrworldwide.com*', '*chartbeat.com*', '*moatads.com*'
+    ]
+
+    # Lean profile chrome switches.
+    lean_args = [
+        '--blink-settings=imagesEnabled=false',
+        '--window-size=1024,768',
+        '--disable-extensions',
+        '--disable-background-networking',
+        '--disable-component-update',
+        '--disable-default-apps',
+        '--disable-sync',
+        '--disable-translate',
+        '--disable-notifications',
+        '--mute-audio',
+        '--autoplay-policy=user-gesture-required',
+        '--disable-features=MediaRouter,OptimizationHints,Translate'
+    ]
+
+    # driver_path (str) - chromedriver binary to use, e.g. '/usr/bin/chromedriver'
+    #                     on the Raspberry Pi. Installed by webdriver_manager if None.
+    # standby (bool) - keep a warm standby session.
+    # max_age (int) - recycle the active session after this many seconds.
+    # max_rss (int) - recycle the active session above this many bytes of RSS.
+    # profile (str) - 'default', or 'lean' to block resources the scraper never
+    #                 uses and turn off unneeded chrome features.
+    def __init__(self, driver_path=None, standby=True, max_age=6*3600, max_rss=1024**3,
+                 profile='default'):
+        assert(profile in ('default', 'lean'))
+        if driver_path:
+            BrowserManager.driver_path = driver_path
+        self.profile = profile
+        self.use_standby = standby
+        self.max_age = max_age
+        self.max_rss = max_rss
+        self.active = None
+        self.standby = None
+        self.warming = None
+        self.lock = threading.Lock()
+        # Metrics
+        self.launches = 0
+        self.launch_secs = 0.0
+        self.last_launch_secs = None
+        self.recycles = 0
+        self.failures = 0
+
+    # Resolves the chromedriver binary, at most once per process.
+    def resolve():
+        if BrowserManager.driver_path is None:
+            # Only imported when there's no configured driver path.
+            from webdriver_manager.chrome import ChromeDriverManager
+            BrowserManager.driver_path = ChromeDriverManager().install()
+        return BrowserManager.driver_path
+
+    def options(self):
+        options = webdriver.ChromeOptions()
+        options.add_argument('log-level=3')
+        options.add_argument('--headless')
+        options.add_argument('--disable-dev-shm-usage') # Only for Ubuntu (?)
+        options.add_argument('--no-sandbox')            # Only for Ubuntu (?)
+        if self.profile == 'lean':
+            for arg in BrowserManager.lean_args:
+                options.add_argument(arg)
+            options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2,
+                'profile.default_content_setting_values.notifications': 2
+            })
+        return options
+
+    # Blocks the lean profile url patterns through the DevTools protocol.
+    def block(self, driver):
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BrowserManager.lean_blocked})
+
+    # Launches a new browser session.
+    def launch(self):
+        start = time.monotonic()
+        driver = webdriver.Chrome(service=ChromeService(BrowserManager.resolve()),
+                                  options=self.options())
+        driver.implicitly_wait(5)
+        if self.profile == 'lean':
+            self.block(driver)
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.launches += 1
+            self.launch_secs += elapsed
+            self.last_launch_secs = elapsed
+        return BrowserSession(driver)
+
+    # Starts launching the standby session in the background, if enabled.
+    def warm(self):
+        if not self.use_standby or self.standby or self.warming:
+            return
+        def run():
+            try:
+                self.standby = self.launch()
+            except Exception as e:
+                print(e)
+        self.warming = threading.Thread(target=run, daemon=True)
+        self.warming.start()
+
+    # Returns the standby session, waiting for it if it's still launching.
+    def take_standby(self):
+        if self.warming:
+            self.warming.join()
+            self.warming = None
+        session, self.standby = self.standby, None
+        return session
+
+    # Returns the driver of the active session, launching one if needed.
+    def acquire(self):
+        if self.active is None:
+            self.active = self.take_standby() or self.launch()
+            self.active.activated = time.monotonic()
+        self.warm()
+        return self.active.driver
+
+    # Replaces the active session, preferring the warm standby.
+    def swap(self):
+        if self.active:
+            self.active.quit()
+        self.active = None
+        return self.acquire()
+
+    # The active session failed, swap it out.
+    def fail(self):
+        self.failures += 1
+        return self.swap()
+
+    # Swaps the active session out if it exceeded the age or memory threshold.
+    # Returns True if it was recycled.
+    def recycle(self):
+        if self.active is None:
+            return False
+        rss = self.active.rss()
+        if self.active.age() > self.max_age or (rss and rss > self.max_rss):
+            self.recycles += 1
+            self.swap()
+            return True
+        return False
+
+    def metrics(self):
+        return {
+            'launches': self.launches,
+            'last_launch_secs': self.last_launch_secs,
+            'mean_launch_secs': self.launch_secs / self.launches if self.launches else None,
+            'recycles': self.recycles,
+            'failures': self.failures,
+            'rss': self.active.rss() if self.active else None,
+            'standby_rss': self.standby.rss() if self.standby else None
+        }
+
+    def close(self):
+        standby = self.take_standby()
+        if standby:
+            standby.quit()
+        if self.active:
+            self.active.quit()
+        self.active = None
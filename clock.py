@@ -0,0 +1,37 @@
+# External imports
+import asyncio
+import datetime
+import time
+
+# Wall clock, used by the Scraper in production.
+class Clock:
+    def now(self, tz=None):
+        return datetime.datetime.now(tz)
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+    async def sleep_async(self, secs):
+        await asyncio.sleep(secs)
+
+# Virtual clock, used to replay recorded runs.
+# Sleeping advances the clock instantly.
+class VirtualClock(Clock):
+    # start (float) - epoch seconds the clock starts at.
+    def __init__(self, start):
+        self.time = start
+        # Wall time spent between consecutive sleeps, i.e. per scrape iteration.
+        self.iterations = []
+        self.mark = time.perf_counter()
+
+    def now(self, tz=None):
+        return datetime.datetime.fromtimestamp(self.time, tz)
+
+    def sleep(self, secs):
+        wall = time.perf_counter()
+        self.iterations.append(wall - self.mark)
+        self.mark = wall
+        self.time += secs
+
+    async def sleep_async(self, secs):
+        self.sleep(secs)
@@ -1,40 +1,174 @@
+# External imports
+import collections
+import csv
+import os
+import threading
+import time
+
+# Internal imports
 from dumper import Dumper
 
+# An open game csv, appended to one row at a time.
+class CSVFile:
+    def __init__(self, filename):
+        self.filename = filename
+        # Columns of the header, empty until the first row is written.
+        self.columns = CSVFile.header(filename)
+        self.known = set(self.columns)
+        self.file = open(filename, 'a', newline='')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+
+    # Returns the columns in the header of the csv, or [] if it has none.
+    def header(filename):
+        if not os.path.exists(filename):
+            return []
+        with open(filename, 'r', newline='') as file:
+            return next(csv.reader(file), [])
+
+    # Appends the row, a dict of column -> value.
+    # Returns True if the file had to be rewritten for new columns.
+    def write(self, row):
+        widened = False
+        if not self.columns:
+            self.columns = list(row)
+            self.known = set(self.columns)
+            self.writer.writerow(self.columns)
+        elif any(not column in self.known for column in row):
+            self.widen(row)
+            widened = True
+        # Columns missing from the row, e.g. a bookmaker that stopped
+        # listing the game, are left empty.
+        self.writer.writerow(['' if row.get(column) is None else row[column]
+                              for column in self.columns])
+        self.file.flush()
+        return widened
+
+    # Rewrites the file with the new columns of the row added to the end of
+    # the header, and empty in the earlier rows.
+    # New columns only show up when a bookmaker starts listing the game.
+    def widen(self, row):
+        self.file.close()
+        self.columns = self.columns + [column for column in row if not column in self.known]
+        self.known = set(self.columns)
+        with open(self.filename, 'r', newline='') as file:
+            rows = list(csv.reader(file))[1:]
+        with open(self.filename+'.tmp', 'w', newline='') as file:
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(self.columns)
+            pad = [''] * len(self.columns)
+            writer.writerows(old + pad[len(old):] for old in rows)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.filename+'.tmp', self.filename)
+        self.file = open(self.filename, 'a', newline='')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+# Writes each game's states and lines to its own csv files.
+#
+# Rows are appended to the open files, and reach the os on every dump.
+# The files of the most recently dumped games are kept open, up to max_open,
+# and are fsynced every fsync_secs seconds and on flush.
+# Dumps are serialized by a lock, as the write pipeline's writers share the
+# open files.
 class CSVDumper(Dumper):
-    def __init__(self, state_outpath, lines_outpath):
+    # max_open (int)      - open files kept, the least recently used are closed.
+    # fsync_secs (float)  - seconds between fsyncs of the open files.
+    def __init__(self, state_outpath, lines_outpath, max_open=32, fsync_secs=30):
         self.state_outpath = state_outpath
         self.lines_outpath = lines_outpath
+        self.max_open = max_open
+        self.fsync_secs = fsync_secs
+        # Maps: filename -> CSVFile, least recently used first.
+        self.files = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.synced = time.monotonic()
+        # Metrics
+        self.rows = 0
+        self.opened = 0
+        self.evicted = 0
+        self.widened = 0
+        self.fsyncs = 0
+
+    # Returns the open csv of the filename, opening it if needed.
+    def open(self, filename):
+        file = self.files.get(filename)
+        if file:
+            self.files.move_to_end(filename)
+            return file
+        if len(self.files) >= self.max_open:
+            _, old = self.files.popitem(last=False)
+            old.close()
+            self.evicted += 1
+        file = self.files[filename] = CSVFile(filename)
+        self.opened += 1
+        return file
 
     # Dump the row to the csv at the given filename
     # Create the csv file if one does not exist
     def dump(self, filename, row):
-        if os.path.exists(filename):
-            df = pd.read_csv(filename)
-            df = pd.concat([df, row.to_frame().T], ignore_index=True)
-            df.to_csv(filename, index=False)
-        else:
-            row.to_frame().T.to_csv(filename, index=False)
+        with self.lock:
+            if self.open(filename).write(row):
+                self.widened += 1
+            self.rows += 1
+            if time.monotonic() - self.synced >= self.fsync_secs:
+                self.sync()
 
     # Build state row and write it out to the game csv at the
     # state output path.
     def dump_state(self, game):
-        row = pd.Series({'timestamp': game.timestamp,
-                         'inning':    game.inning,
-                         'is_bot':    game.is_bot,
-                         'outs':      game.outs,
-                         'away':      game.score[0],
-                         'home':      game.score[1],
-                         '1B':        int(game.runners[0]),
-                         '2B':        int(game.runners[1]),
-                         '3B':        int(game.runners[2]),
-                         'batter':    game.batter,
-                         'pitcher':   game.pitcher,
-                         'balls':     game.count[0],
-                         'strikes':   game.count[1]})
+        row = {'timestamp': game.timestamp,
+               'inning':    game.inning,
+               'is_bot':    game.is_bot,
+               'outs':      game.outs,
+               'away':      game.score[0],
+               'home':      game.score[1],
+               '1B':        int(game.runners[0]),
+               '2B':        int(game.runners[1]),
+               '3B':        int(game.runners[2]),
+               'batter':    game.batter,
+               'pitcher':   game.pitcher,
+               'balls':     game.count[0],
+               'strikes':   game.count[1]}
 
         self.dump(self.state_outpath+f'/{game.id}.csv', row)
 
     # Build lines row and write it out to the game csv at the
     # lines output path.
-    def dump_lines(self, game):
-        self.dump(self.lines_outpath+f'/{game.id}.csv', game.line_info)
+    # The row holds every market of the game, lines only picks whether
+    # there's a row to write.
+    def dump_lines(self, game, lines=None):
+        self.dump(self.lines_outpath+f'/{game.id}.csv', game.line_info.to_row(game.timestamp))
+
+    # fsyncs the open files.
+    def sync(self):
+        for file in self.files.values():
+            file.sync()
+        self.fsyncs += 1
+        self.synced = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self.sync()
+
+    def close(self):
+        with self.lock:
+            for file in self.files.values():
+                file.close()
+            self.files.clear()
+
+    def metrics(self):
+        with self.lock:
+            return {'rows': self.rows,
+                    'open_files': len(self.files),
+                    'opened': self.opened,
+                    'evicted': self.evicted,
+                    'widened': self.widened,
+                    'fsyncs': self.fsyncs}
@@ -7,5 +7,24 @@ class Dumper:
     def dump_state(self, game):
         assert(False) # Should not be called
 
-    def dump_lines(self, game):
+    # lines (LineSnapshot) - the lines of the game that moved since its last
+    #                        dump, all of game.line_info if None.
+    def dump_lines(self, game, lines=None):
         assert(False) # Should not be called
+
+    # Ends an iteration's dumps. Dumpers that batch rows write them out here.
+    def commit(self):
+        pass
+
+    # Blocks until every dumped row has been written out.
+    # Dumpers that write synchronously have nothing to flush.
+    def flush(self):
+        pass
+
+    # Writes out any buffered rows and releases the dumper's resources.
+    def close(self):
+        self.flush()
+
+    # Returns a dict of the dumper's statistics.
+    def metrics(self):
+        return {}
@@ -0,0 +1,392 @@
+# External imports
+import bs4 as bs
+import datetime
+import enum
+import hashlib
+import pytz
+import re
+
+class SoupExtractor:
+    # Walks a singleGameContainer exactly once and collects every value that
+    # the SoupParser getters would otherwise find with their own traversals.
+    #
+    # The getters below return the same values as their SoupParser
+    # counterparts, so parse_pre/parse_live/parse_post produce identical dicts.
+
+    # Count wrapper class, as matched by SoupParser.get_count.
+    count_classes = set(('class', 'inningStatestyle__StyledCountWrapper-sc-ywgvyn-2 hFpAXK'))
+
+    # Fill color of an occupied base.
+    runner_fill = '#EFB21F'
+
+    # Status patterns, compiled once.
+    time_ptrn = re.compile(r'^\d?\d\:\d\d [AP]M ET')
+    final_ptrn = re.compile(r'Final')
+    postponed_ptrn = re.compile(r'Postponed')
+    valid_innings = set(('Top', 'Bot', 'Mid', 'End'))
+
+    def __init__(self, soup):
+        # Raw text fields, None if the element wasn't found.
+        self.inning_text = None
+        self.start_text = None
+        self.final_text = None
+        self.count_text = None
+        # Text of the second <title>, which holds the outs.
+        self.outs_text = None
+        self.n_titles = 0
+        # Fill attribute of every <rect>, None if the attribute is missing.
+        self.fills = []
+        # Text of every player name label.
+        self.players = []
+        # Text of the first <div> inside each team name label.
+        self.team_texts = []
+        # Rows of the second <table>, each a list of the text of the first
+        # <div> inside each of the row's cells.
+        self.n_tables = 0
+        self.box_rows = []
+        self.walk(soup)
+
+    # Single pre-order traversal of the container.
+    #
+    # Text for the elements we care about is accumulated into buffers that stay
+    # open while the element is on the stack, so no element is re-walked to
+    # compute its text.
+    def walk(self, soup):
+        text_types = soup.interesting_string_types
+        buffers = []     # open text buffers
+        labels = []      # open team name labels, waiting for their first div
+        box_table = []   # open second table (at most one entry)
+        box_trs = []     # open rows of the second table
+        box_tds = []     # open cells of the second table, waiting for their first div
+        stack = [(child, None) for child in reversed(soup.contents)]
+        while stack:
+            node, opened = stack.pop()
+            # Leaving a tag, close everything it opened.
+            if opened is not None:
+                for lst in opened:
+                    lst.pop()
+                continue
+            if not isinstance(node, bs.Tag):
+                if type(node) in text_types:
+                    for buf in buffers:
+                        buf.append(node)
+                continue
+            opened = self.enter(node, buffers, labels, box_table, box_trs, box_tds)
+            stack.append((node, opened))
+            stack.extend((child, None) for child in reversed(node.contents))
+        self.team_texts = [''.join(label[0]) if label[0] is not None else None
+                           for label in self.team_texts]
+        self.box_rows = [[''.join(td[0]) if td[0] is not None else None for td in row]
+                         for row in self.box_rows]
+        for key in ('inning_text', 'start_text', 'final_text', 'count_text', 'outs_text'):
+            if getattr(self, key) is not None:
+                setattr(self, key, ''.join(getattr(self, key)))
+        self.players = [''.join(player) for player in self.players]
+        self.fingerprint = self.hash()
+
+    # Hash of the raw fields collected by the walk.
+    # Every value the getters return is derived from these fields, so soups
+    # with the same fingerprint parse the same.
+    def hash(self):
+        fields = (self.inning_text, self.start_text, self.final_text, self.count_text,
+                  self.outs_text, self.n_titles, self.fills, self.players,
+                  self.team_texts, self.n_tables, self.box_rows)
+        return hashlib.blake2b(repr(fields).encode(), digest_size=16).digest()
+
+    # Opens a text buffer and registers it for closing when the tag is left.
+    def open_buffer(buffers, opened):
+        buf = []
+        buffers.append(buf)
+        opened.append(buffers)
+        return buf
+
+    # Classifies a tag on entry.
+    # Returns the list of stacks the tag pushed onto.
+    def enter(self, tag, buffers, labels, box_table, box_trs, box_tds):
+        opened = []
+        name = tag.name
+        attrs = tag.attrs
+        test_id = attrs.get('data-mlb-test')
+        if name == 'div':
+            # First div inside an open team label or box score cell.
+            for label in labels:
+                if label[0] is None:
+                    label[0] = SoupExtractor.open_buffer(buffers, opened)
+            for td in box_tds:
+                if td[0] is None:
+                    td[0] = SoupExtractor.open_buffer(buffers, opened)
+            if test_id == 'inningNumberLabel' and self.inning_text is None:
+                self.inning_text = SoupExtractor.open_buffer(buffers, opened)
+            elif test_id == 'gameStartTimesStateLabel' and self.start_text is None:
+                self.start_text = SoupExtractor.open_buffer(buffers, opened)
+            elif test_id == 'playerNameLinks':
+                self.players.append(SoupExtractor.open_buffer(buffers, opened))
+            elif test_id == 'teamNameLabel':
+                label = [None]
+                self.team_texts.append(label)
+                labels.append(label)
+                opened.append(labels)
+            if self.count_text is None and 'class' in attrs:
+                classes = attrs['class']
+                if (' '.join(classes) in SoupExtractor.count_classes or
+                        not SoupExtractor.count_classes.isdisjoint(classes)):
+                    self.count_text = SoupExtractor.open_buffer(buffers, opened)
+        elif name == 'span':
+            if test_id == 'gameStartTimesStateLabel' and self.final_text is None:
+                self.final_text = SoupExtractor.open_buffer(buffers, opened)
+        elif name == 'title':
+            self.n_titles += 1
+            if self.n_titles == 2:
+                self.outs_text = SoupExtractor.open_buffer(buffers, opened)
+        elif name == 'rect':
+            self.fills.append(attrs.get('fill'))
+        elif name == 'table':
+            self.n_tables += 1
+            if self.n_tables == 2:
+                box_table.append(tag)
+                opened.append(box_table)
+        elif name == 'tr' and box_table:
+            row = []
+            self.box_rows.append(row)
+            box_trs.append(row)
+            opened.append(box_trs)
+        elif name == 'td' and box_trs:
+            td = [None]
+            for row in box_trs:
+                row.append(td)
+            box_tds.append(td)
+            opened.append(box_tds)
+        return opened
+
+    #
+    # Getters, mirroring SoupParser.
+    #
+
+    def get_inning(self):
+        return self.inning_text if self.inning_text is not None else ''
+
+    def get_start_time_str(self):
+        return self.start_text if self.start_text is not None else ''
+
+    def get_final(self):
+        return self.final_text if self.final_text is not None else ''
+
+    def get_score(self):
+        try:
+            # Note: the 0th row of the table is the table header
+            get_score = lambda row: int(self.box_rows[1+row][0])
+            return get_score(0), get_score(1)
+        except:
+            return None
+
+    def get_outs(self):
+        try:
+            outs = int(self.outs_text[0])
+            assert(outs <= 3 and outs >= 0)
+            return outs
+        except:
+            return None
+
+    def get_runners(self):
+        if None in self.fills:
+            return [None, None, None]
+        return [int(fill == SoupExtractor.runner_fill) for fill in reversed(self.fills)]
+
+    def get_count(self):
+        try:
+            return [int(x) for x in self.count_text.split(' - ')]
+        except:
+            return [None, None]
+
+    def get_pitcher(self):
+        return self.players[0] if len(self.players) == 2 else None
+
+    def get_batter(self):
+        return self.players[1] if len(self.players) == 2 else None
+
+    def get_teams(self):
+        if len(self.team_texts) < 2 or None in self.team_texts[:2]:
+            return (None, None)
+        return (self.team_texts[0], self.team_texts[1])
+
+    #
+    # Status checks, mirroring SoupParser.
+    #
+
+    def is_warmup(self):
+        return self.get_inning() == 'Warmup'
+
+    def is_pregame(self):
+        return bool(SoupExtractor.time_ptrn.match(self.get_start_time_str()))
+
+    def get_start_time(self):
+        start_str = SoupExtractor.time_ptrn.match(self.get_start_time_str()).group(0)
+        eastern = pytz.timezone('US/Eastern')
+        today = datetime.datetime.now().astimezone(eastern)
+        start_time = datetime.datetime.strptime(start_str, "%I:%M %p ET")
+        start_time.replace(year=today.year, month=today.month, day=today.day, tzinfo=eastern)
+        return start_time
+
+    def is_delayed(self):
+        return 'Delayed Start' in self.get_start_time_str()
+
+    def is_suspended(self):
+        return 'Suspended' in self.get_start_time_str()
+
+    def is_live(self):
+        return (self.get_inning()[:3] in SoupExtractor.valid_innings and
+                not self.is_suspended())
+
+    def is_final(self):
+        return bool(SoupExtractor.final_ptrn.match(self.get_final()))
+
+    def is_postponed(self):
+        return bool(SoupExtractor.postponed_ptrn.match(self.get_final()))
+
+    #
+    # Parsers, producing the same dicts as SoupParser.parse_*.
+    #
+
+    def parse_pre(self):
+        return {
+            'start_time': self.get_start_time_str(),
+            'teams': self.get_teams()
+        }
+
+    def parse_live(self):
+        return {
+            'inning': self.get_inning(),
+            'score': self.get_score(),
+            'outs': self.get_outs(),
+            'runners': self.get_runners(),
+            'count': self.get_count(),
+            'pitcher': self.get_pitcher(),
+            'batter': self.get_batter(),
+            'teams': self.get_teams()
+        }
+
+    def parse_post(self):
+        return {
+            'is_final': self.is_final(),
+            'score': self.get_score(),
+            'teams': self.get_teams()
+        }
+
+
+# Status of a game soup, in the order the Scraper classifies them.
+class GameStatus(enum.Enum):
+    WARMUP = 'warmup'
+    LIVE = 'live'
+    PREGAME = 'pregame'
+    FINAL = 'final'
+    POSTPONED = 'postponed'
+    SUSPENDED = 'suspended'
+    UNKNOWN = 'unknown'
+
+# Caches the value of a ParsedGame attribute in its '_'-prefixed slot,
+# so each value is computed at most once, on first access.
+class lazy:
+    def __init__(self, func):
+        self.func = func
+        self.slot = '_' + func.__name__
+
+    def __get__(self, record, cls):
+        if record is None:
+            return self
+        try:
+            return getattr(record, self.slot)
+        except AttributeError:
+            value = self.func(record)
+            setattr(record, self.slot, value)
+            return value
+
+class ParsedGame:
+    # Read-only record of a single game soup.
+    #
+    # The soup is walked once, the first time any field is read, and every
+    # derived value (status, teams, state fields) is computed once and kept.
+
+    __slots__ = ('soup', '_fingerprint', '_extractor', '_status', '_teams', '_start_time',
+                 '_is_delayed', '_is_postponed', '_is_suspended', '_inning',
+                 '_score', '_outs', '_runners', '_count', '_pitcher', '_batter')
+
+    def __init__(self, soup):
+        self.soup = soup
+
+    # Hash of the fields collected by the extractor's walk, see
+    # SoupExtractor.hash. A soup that turns out unchanged is walked once and
+    # never parsed, and a changed one reuses the walk for its parse.
+    @lazy
+    def fingerprint(self):
+        return self.extractor.fingerprint
+
+    @lazy
+    def extractor(self):
+        return SoupExtractor(self.soup)
+
+    @lazy
+    def status(self):
+        if self.extractor.is_warmup():
+            return GameStatus.WARMUP
+        elif self.extractor.is_live():
+            return GameStatus.LIVE
+        elif self.extractor.is_pregame():
+            return GameStatus.PREGAME
+        elif self.extractor.is_final():
+            return GameStatus.FINAL
+        elif self.is_postponed:
+            return GameStatus.POSTPONED
+        elif self.is_suspended:
+            return GameStatus.SUSPENDED
+        return GameStatus.UNKNOWN
+
+    @lazy
+    def teams(self):
+        return self.extractor.get_teams()
+
+    # Only valid for pregame soups.
+    @lazy
+    def start_time(self):
+        return self.extractor.get_start_time()
+
+    @lazy
+    def is_delayed(self):
+        return self.extractor.is_delayed()
+
+    @lazy
+    def is_postponed(self):
+        return self.extractor.is_postponed()
+
+    @lazy
+    def is_suspended(self):
+        return self.extractor.is_suspended()
+
+    # Live game state fields, see SoupParser.live_funcs.
+
+    @lazy
+    def inning(self):
+        return self.extractor.get_inning()
+
+    @lazy
+    def score(self):
+        return self.extractor.get_score()
+
+    @lazy
+    def outs(self):
+        return self.extractor.get_outs()
+
+    @lazy
+    def runners(self):
+        return self.extractor.get_runners()
+
+    @lazy
+    def count(self):
+        return self.extractor.get_count()
+
+    @lazy
+    def pitcher(self):
+        return self.extractor.get_pitcher()
+
+    @lazy
+    def batter(self):
+        return self.extractor.get_batter()
@@ -1,39 +1,26 @@
 import datetime
-import pandas as pd
 import pytz
-import os
+import sys
+
+from csvdumper import CSVFile
+from linesnapshot import LineSnapshot
+from teams import TeamRegistry
 
 
 class GameState:
     # This is necessary for tracking double headers
     prefix_ids = {} # game prefix, 'home team id' + 'date' -> frequency
 
-    # Load dataframe of team info
-    teams_df = pd.read_csv('./data/TEAM2022', header=None)
-    teams_df.columns = ['id', 'league', 'city', 'name']
-
     # Home team name to Retrosheets team id
-    def get_team_id(name):
-        words = name.split(' ')
-        for i in range(1, len(words)+1):
-            phrase = ''
-            for word in words[len(words)-i:]:
-                phrase += word
-                phrase += ' '
-            phrase = phrase [:-1] # remove trailing space
-            try:
-                return GameState.teams_df.loc[
-                        GameState.teams_df['name'] == phrase]['id'].to_numpy()[0]
-            except:
-                pass
-        print(f'ERROR: Couldnt find {name} in ./data/TEAM2022 list.')
-        assert(False)
+    # season (int) - season of the game, the current one if None.
+    def get_team_id(name, season=None):
+        return TeamRegistry.for_season(season).resolve(name)
 
     # Get game id prefix.
     # Prefix = home team id + date
     def get_id_prefix(name, strt_time=None):
         strt_time = datetime.datetime.now(pytz.timezone('US/Pacific')) if strt_time == None else strt_time
-        return GameState.get_team_id(name) + strt_time.strftime('%Y%m%d')
+        return GameState.get_team_id(name, strt_time.year) + strt_time.strftime('%Y%m%d')
 
     # Make a game id for a new game, given the prefix.
     def new_game_id(prefix):
@@ -46,6 +33,17 @@ class GameState:
             GameState.prefix_ids[prefix] = 1
         return prefix + suffix
 
+    # Drops prefix counters for dates before the given 'YYYYMMDD' date.
+    # Prefixes in keep are still held by in-memory games and are kept, so
+    # their double-header suffix numbering carries on.
+    # Returns the number of counters dropped.
+    def prune_prefixes(before, keep):
+        stale = [prefix for prefix in GameState.prefix_ids
+                    if prefix[-8:] < before and not prefix in keep]
+        for prefix in stale:
+            del GameState.prefix_ids[prefix]
+        return len(stale)
+
 
     def __init__(self, id, dump_to_sql=False):
         # Id
@@ -57,6 +55,7 @@ class GameState:
         # State features
         self.timestamp = None
         self.inning = None
+        self.half = None # 'Top', 'Bot', 'Mid', 'End'
         self.is_bot = None
         self.outs = None
         self.score = [0, 0]
@@ -66,59 +65,79 @@ class GameState:
         self.count = (None, None)
         # Line information
         self.line_info = None
+        # Recorded states (GameHistory), if tracked.
+        self.history = None
         # Write to a MySQL DB (to CSV if not enabled)
         self.enable_sql = dump_to_sql
 
+    # Refresh the game's timestamp and lines, without changing its state.
+    # new_lines (LineSnapshot) - shared with the other iterations that reuse
+    #                            the same odds response, so it's not modified.
+    def refresh(self, timestamp, new_lines):
+        # The state is unchanged, so it's only recorded if the lines changed.
+        changed = not new_lines is self.line_info
+        self.timestamp = timestamp
+        self.line_info = new_lines
+        if not self.history is None and changed:
+            self.history.append(self)
+
+    # new_state (ParsedGame) - record of the live game soup.
     def update(self, timestamp, new_state, new_lines):
         self.timestamp = timestamp
         self.line_info = new_lines
-        if not self.line_info is None:
-            self.line_info['timestamp'] = timestamp
+        self.teams = list(new_state.teams)
         # 'Top #', 'Bot #', 'Mid #', 'End #'
-        self.inning = int(new_state['inning'][4:])
-        self.is_bot = int(new_state['inning'][:3] == 'Bot' or
-                          new_state['inning'][:3] == 'Mid' or
-                          new_state['inning'][:3] == 'End')
-        self.outs = new_state['outs'] % 3
-        self.score = new_state['score']
-        self.runners = new_state['runners']
-        self.batter = new_state['batter']
-        self.pitcher = new_state['pitcher']
-        self.count = new_state['count']
+        inning = new_state.inning
+        self.inning = int(inning[4:])
+        self.half = inning[:3]
+        self.is_bot = int(inning[:3] == 'Bot' or
+                          inning[:3] == 'Mid' or
+                          inning[:3] == 'End')
+        self.outs = new_state.outs % 3
+        self.score = new_state.score
+        self.runners = new_state.runners
+        self.batter = new_state.batter
+        self.pitcher = new_state.pitcher
+        self.count = new_state.count
+        if not self.history is None:
+            self.history.append(self)
+
+    # Approximate bytes retained by the game, including its line snapshot.
+    def retained_bytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        if not self.line_info is None:
+            size += self.line_info.nbytes()
+        return size
 
     def dump_to_sql(self, db_cursor, rtype, row):
         assert(rtype in ('state', 'lines'))
 
     def dump_to_csv(self, path, row):
-        filename = path+f'/{self.id}.csv'
-        if os.path.exists(filename):
-            df = pd.read_csv(filename)
-            df = pd.concat([df, row.to_frame().T], ignore_index=True)
-            df.to_csv(filename, index=False)
-        else:
-            row.to_frame().T.to_csv(filename, index=False)
+        file = CSVFile(path+f'/{self.id}.csv')
+        file.write(row)
+        file.close()
 
     def dump(self, *argv):
         self.dump_to_sql(argv[0], argv[1], argv[2]) if self.enable_sql else self.dump_to_csv(argv[0], argv[1])
 
     def dump_state(self, path):
-        row = pd.Series({'timestamp': self.timestamp,
-                         'inning':    self.inning,
-                         'is_bot':    self.is_bot,
-                         'outs':      self.outs,
-                         'away':      self.score[0],
-                         'home':      self.score[1],
-                         '1B':        int(self.runners[0]),
-                         '2B':        int(self.runners[1]),
-                         '3B':        int(self.runners[2]),
-                         'batter':    self.batter,
-                         'pitcher':   self.pitcher,
-                         'balls':     self.count[0],
-                         'strikes':   self.count[1]})
+        row = {'timestamp': self.timestamp,
+               'inning':    self.inning,
+               'is_bot':    self.is_bot,
+               'outs':      self.outs,
+               'away':      self.score[0],
+               'home':      self.score[1],
+               '1B':        int(self.runners[0]),
+               '2B':        int(self.runners[1]),
+               '3B':        int(self.runners[2]),
+               'batter':    self.batter,
+               'pitcher':   self.pitcher,
+               'balls':     self.count[0],
+               'strikes':   self.count[1]}
         self.dump(path, row)
 
     def dump_lines(self, path):
-        self.dump(path, self.line_info)
+        self.dump(path, self.line_info.to_row(self.timestamp))
 
     def __str__(self):
         # Build game state string
@@ -140,5 +159,5 @@ class GameState:
         state_str += f"  .\n"
         state_str += f"\n"
         if not self.line_info is None:
-            state_str += str(self.line_info.filter(regex='fanduel'))
+            state_str += str(LineSnapshot(tuple(self.line_info.bookmaker('fanduel'))))
         return state_str
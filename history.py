@@ -0,0 +1,197 @@
+# External imports
+import array
+import datetime
+import math
+import pytz
+import sys
+
+# Internal imports
+from linesnapshot import MarketLine
+
+# Trajectory of one game, as columns of its recorded states.
+#
+# Each column is an array holding one value per recorded state, oldest first,
+# until capacity states are held. After that the columns are a ring buffer,
+# and each new state overwrites the oldest one.
+#
+# State columns use the dump_state names. Missing runners and counts are
+# stored as -1.
+# Line columns use the legacy csv names, e.g. 'fanduel_h2h_H_price', and
+# hold nan where the market wasn't listed.
+class GameHistory:
+    # Column -> array typecode
+    state_columns = {
+        'inning':  'b',
+        'is_bot':  'b',
+        'outs':    'b',
+        'away':    'h',
+        'home':    'h',
+        '1B':      'b',
+        '2B':      'b',
+        '3B':      'b',
+        'balls':   'b',
+        'strikes': 'b'
+    }
+
+    # Maps: (bookmaker, market, field) -> line column name, shared by every game.
+    line_names = {}
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        # Index of the oldest state once the buffer is full.
+        self.start = 0
+        # Posix timestamps of the states
+        self.times = array.array('d')
+        self.columns = {name: array.array(code) for name, code in GameHistory.state_columns.items()}
+        self.lines = {}
+        # Line snapshot of the last recorded state.
+        self.last_lines = None
+
+    def __len__(self):
+        return len(self.times)
+
+    # Physical index of the i-th state, oldest first.
+    def at(self, i):
+        return (self.start + i) % self.capacity
+
+    # Returns the name of a line column, e.g. 'fanduel_spreads_H_point'.
+    def line_name(bookmaker, market, field):
+        key = (bookmaker, market, field)
+        name = GameHistory.line_names.get(key)
+        if name is None:
+            name = GameHistory.line_names[key] = f'{bookmaker}_{market}_{field}'
+        return name
+
+    # Records the state of the game.
+    # game (GameState) - live game, after an update or a refresh.
+    def append(self, game):
+        count = game.count
+        # Runners are all None when a base's fill couldn't be read.
+        runners = [int(runner) if runner is not None else -1 for runner in game.runners]
+        state = (game.inning, game.is_bot, game.outs,
+                 game.score[0], game.score[1],
+                 runners[0], runners[1], runners[2],
+                 count[0] if count[0] is not None else -1,
+                 count[1] if count[1] is not None else -1)
+        lines = {}
+        if game.line_info is not None:
+            for line in game.line_info:
+                for field, value in zip(MarketLine.fields[line.market], line.values):
+                    lines[GameHistory.line_name(line.bookmaker, line.market, field)] = value
+        self.last_lines = game.line_info
+        timestamp = game.timestamp.timestamp()
+
+        # Grow the columns until the buffer is full.
+        if len(self.times) < self.capacity:
+            size = len(self.times)
+            self.times.append(timestamp)
+            for column, value in zip(self.columns.values(), state):
+                column.append(value)
+            for name, column in self.lines.items():
+                column.append(lines.pop(name, math.nan))
+            # Markets seen for the first time, missing from the earlier states.
+            for name, value in lines.items():
+                column = self.lines[name] = array.array('d', [math.nan]) * size
+                column.append(value)
+            return
+
+        # Overwrite the oldest state.
+        i = self.start
+        self.start = (self.start + 1) % self.capacity
+        self.times[i] = timestamp
+        for column, value in zip(self.columns.values(), state):
+            column[i] = value
+        for name, column in self.lines.items():
+            column[i] = lines.pop(name, math.nan)
+        for name, value in lines.items():
+            column = self.lines[name] = array.array('d', [math.nan]) * self.capacity
+            column[i] = value
+
+    # Returns the logical index of the last state at or before the time, or -1.
+    def index_of(self, time):
+        time = time.timestamp()
+        lo, hi = 0, len(self.times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self.at(mid)] <= time:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    # Returns the i-th state (logical index) as a dict of the columns.
+    def row(self, i):
+        i = self.at(i)
+        row = {'timestamp': datetime.datetime.fromtimestamp(self.times[i], pytz.timezone('US/Pacific'))}
+        for name, column in self.columns.items():
+            row[name] = column[i]
+        for name in ('1B', '2B', '3B', 'balls', 'strikes'):
+            if row[name] == -1:
+                row[name] = None
+        for name, column in self.lines.items():
+            value = column[i]
+            row[name] = None if math.isnan(value) else value
+        return row
+
+    # Returns the last n states, oldest first.
+    def latest(self, n=1):
+        return [self.row(i) for i in range(max(len(self.times) - n, 0), len(self.times))]
+
+    # Returns the state of the game as of the time, or None if it's before
+    # the oldest state held.
+    def as_of(self, time):
+        i = self.index_of(time)
+        return self.row(i) if i >= 0 else None
+
+    # Returns the line columns that moved since the time, as
+    # column -> (value as of the time, latest value).
+    # Values are None where the market wasn't listed. States older than the
+    # buffer are gone, so the oldest state held is used for earlier times.
+    def movement(self, since):
+        if not self.times:
+            return {}
+        then, now = self.at(max(self.index_of(since), 0)), self.at(len(self.times) - 1)
+        moved = {}
+        for name, column in self.lines.items():
+            before, after = column[then], column[now]
+            if before != after and not (math.isnan(before) and math.isnan(after)):
+                moved[name] = (None if math.isnan(before) else before,
+                               None if math.isnan(after) else after)
+        return moved
+
+    # Bytes held by the columns.
+    def nbytes(self):
+        size = sys.getsizeof(self.times)
+        for column in self.columns.values():
+            size += sys.getsizeof(column)
+        for column in self.lines.values():
+            size += sys.getsizeof(column)
+        return size
+
+# In-memory histories of the tracked games, fed by GameState.update and
+# GameState.refresh. Queries don't touch the disk or the network.
+class HistoryStore:
+    # capacity (int) - states held per game, the oldest are overwritten.
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        # Maps: game id -> GameHistory
+        self.games = {}
+
+    # Returns the history of the game, creating it if needed.
+    def track(self, id):
+        if not id in self.games:
+            self.games[id] = GameHistory(self.capacity)
+        return self.games[id]
+
+    # Returns the history of the game, or None if it isn't tracked.
+    def game(self, id):
+        return self.games.get(id)
+
+    # Drops the history of an archived game.
+    def forget(self, id):
+        self.games.pop(id, None)
+
+    def metrics(self):
+        return {'games': len(self.games),
+                'states': sum(len(history) for history in self.games.values()),
+                'bytes': sum(history.nbytes() for history in self.games.values())}
@@ -0,0 +1,77 @@
+# External imports
+import threading
+
+# Internal imports
+from linesnapshot import LineSnapshot
+
+# Last seen cache of the lines written out for each game, used to only emit
+# the markets that moved since the last write.
+#
+# A market is keyed on (game id, bookmaker, market), and has moved if its last
+# update or any of its prices and points differ from the last one written.
+# Markets are recorded as written when they're emitted. Rows that are then
+# lost, e.g. dropped by the write pipeline, are reverted so their markets are
+# emitted again.
+class LineFilter:
+    def __init__(self):
+        # Maps: (game id, bookmaker, market) -> (last update (str), values)
+        self.seen = {}
+        # Writer threads revert lost rows while the scraper filters.
+        self.lock = threading.Lock()
+        self.emitted = 0
+        self.filtered = 0
+        self.reverted = 0
+
+    # Last updates are compared at the database's precision, as read back
+    # from the database (datetime) or carried by a MarketLine (str).
+    def key(last, values):
+        return (last.strftime('%Y-%m-%d %H:%M:%S') if not isinstance(last, str) else last[:19],
+                tuple(round(value, 4) if isinstance(value, float) else value for value in values))
+
+    # Returns the lines of the snapshot that moved since the game's last write,
+    # as a LineSnapshot, and records them as written.
+    def changed(self, id, snapshot):
+        lines = []
+        with self.lock:
+            for line in snapshot:
+                key = (id, line.bookmaker, line.market)
+                seen = LineFilter.key(line.last, line.values)
+                if self.seen.get(key) != seen:
+                    self.seen[key] = seen
+                    lines.append(line)
+            self.emitted += len(lines)
+            self.filtered += len(snapshot) - len(lines)
+        return LineSnapshot(tuple(lines))
+
+    # Forgets the markets of a lines row that wasn't written, so they're
+    # emitted again by the next iteration. Markets that moved since are kept.
+    def revert(self, id, lines):
+        with self.lock:
+            for line in lines:
+                key = (id, line.bookmaker, line.market)
+                if self.seen.get(key) == LineFilter.key(line.last, line.values):
+                    del self.seen[key]
+                    self.reverted += 1
+
+    # Seeds the cache with lines already written, e.g. Database.last_lines().
+    # rows - iterable of (game id, bookmaker, market, last update, values)
+    def warm(self, rows):
+        count = 0
+        with self.lock:
+            for id, bookmaker, market, last, values in rows:
+                self.seen[(id, bookmaker, market)] = LineFilter.key(last, values)
+                count += 1
+        return count
+
+    # Drops the cache entries of an archived game.
+    def forget(self, id):
+        with self.lock:
+            for key in [key for key in self.seen if key[0] == id]:
+                del self.seen[key]
+
+    def metrics(self):
+        with self.lock:
+            return {'markets': len(self.seen),
+                    'emitted': self.emitted,
+                    'filtered': self.filtered,
+                    'reverted': self.reverted}
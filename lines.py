@@ -1,6 +1,7 @@
 # External imports
+import codecs
 import datetime
-import pandas as pd
+import json
 import pytz
 import requests
 import sys
@@ -8,7 +9,10 @@ import yaml
 
 # Internal imports
 sys.path.insert(0, '../')
+from clock import Clock
 from game import GameState
+from linesnapshot import LineSnapshot, MarketLine
+from oddsclient import CircuitOpen, OddsClient
 
 class LineGenerator:
     default_params = {
@@ -16,99 +20,411 @@ class LineGenerator:
                       'REGIONS': 'us',                 # uk | us | eu | au.
                       'MARKETS': 'h2h,spreads,totals', # h2h | spreads | totals
                       'ODDS_FORMAT': 'decimal',        # decimal | american
-                      'DATE_FORMAT': 'iso'             # iso | unix
+                      'DATE_FORMAT': 'iso',            # iso | unix
+                      'BOOKMAKERS': None               # comma separated allow-list, e.g.
+                                                       # 'draftkings,fanduel'. Overrides REGIONS.
                      }
 
-    def __init__(self, key, id_prefix_func=GameState.get_id_prefix, params=default_params):
+    # Games are active, and their lines are formatted, from this long before
+    # their listed start time until this long after it, and for as long as
+    # the scraper has them live.
+    lead_time = datetime.timedelta(minutes=15)
+    game_time = datetime.timedelta(hours=5)
+
+    # recorder (Recorder) - if set, every api response is recorded for replay.
+    # ttl (int)           - seconds the formatted lines are reused for while
+    #                       games are active, before the budget is applied.
+    # idle_ttl (int)      - seconds the lines are reused for with no active games.
+    # clock (Clock)       - source of the current time.
+    # scoped (bool)       - only query the odds of live and about to start games.
+    # stream (bool)       - decode and format the response one game at a time,
+    #                       as it's downloaded.
+    # client (OddsClient) - http client for the api, a default one if None.
+    def __init__(self, key, id_prefix_func=GameState.get_id_prefix, params=default_params,
+                 recorder=None, ttl=0, idle_ttl=0, clock=None, scoped=False, stream=False,
+                 client=None):
         self.key = key
-        self.params = params
+        self.client = client if client else OddsClient(key)
+        self.params = dict(LineGenerator.default_params, **params)
+        self.bookmakers = (set(self.params['BOOKMAKERS'].split(','))
+                           if self.params['BOOKMAKERS'] else None)
         self.remaining, self.used = -1, -1   # unkown at initialization time
         self.get_id_prefix = id_prefix_func
+        self.recorder = recorder
+        self.clock = clock if clock else Clock()
+        # Cache of the last formatted response
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.cached = None
+        self.cached_at = None
+        # Event ids of the cached response, None if it holds every event.
+        self.cached_scope = None
+        # Event scoped queries
+        # Maps: event id (str) -> (commence_time (str), id prefix, start time)
+        self.scoped = scoped
+        self.stream = stream
+        self.events = {}
+        self.events_at = None
+        # Requests used per query, as last observed.
+        self.cost = 1
+        self.queries = 0
+        self.hits = 0
+        # Last lines returned, served again if the api can't be reached.
+        self.last_good = None
+        self.fallbacks = 0
+        # Maps: api time string -> (eastern datetime, eastern time str)
+        #       e.g. '2023-03-30T20:05:00Z' -> (datetime, '2023-03-30 16:05:00-04:00')
+        self.times = {}
 
     tchar = lambda name, teams: 'A' if name == teams[0] else 'H'
-    ochar = lambda name: 'O' if name == 'over' else 'U'
 
     to_eastern = lambda time: datetime.datetime.strptime(time, '%Y-%m-%dT%H:%M:%SZ'
                                           ).replace(tzinfo=pytz.utc
                                           ).astimezone(pytz.timezone('US/Eastern'))
 
-    def process_moneyline(prefix, market, teams):
+    # Size past which the time cache is cleared.
+    max_times = 10000
+
+    # Converts the api time strings of a response to eastern time.
+    # Most books and markets share a handful of last update times, so each
+    # distinct string is parsed once, in one pass, and cached across responses.
+    def convert_times(self, response):
+        times = set()
+        for game in response:
+            times.add(game['commence_time'])
+            for book in game.get('bookmakers', ()):
+                times.add(book['last_update'])
+                for market in book['markets']:
+                    times.add(market['last_update'])
+        missing = [time for time in times if not time in self.times]
+        if len(self.times) + len(missing) > LineGenerator.max_times:
+            self.times = {}
+            missing = list(times)
+        eastern = pytz.timezone('US/Eastern')
+        for time in missing:
+            # Note: fromisoformat only reads a trailing 'Z' from python 3.11
+            converted = datetime.datetime.fromisoformat(time.replace('Z', '+00:00')).astimezone(eastern)
+            self.times[time] = (converted, str(converted))
+
+    # Returns the eastern datetime of an api time string.
+    def eastern(self, time):
+        if not time in self.times:
+            converted = LineGenerator.to_eastern(time)
+            self.times[time] = (converted, str(converted))
+        return self.times[time][0]
+
+    # Market value builders, return the values in the order of MarketLine.fields.
+    def process_moneyline(market, teams):
         assert(market['key'] == 'h2h')
         assert(len(market['outcomes']) == 2)
-        lines = {}
+        prices = {}
         for outcome in market['outcomes']:
             assert(outcome['name'] in teams)
-            lines[prefix+LineGenerator.tchar(outcome['name'], teams)+'_price'] = outcome['price']
-        return lines
+            prices[LineGenerator.tchar(outcome['name'], teams)] = outcome['price']
+        return (prices['H'], prices['A'])
 
-    def process_spread(prefix, market, teams):
+    def process_spread(market, teams):
         assert(market['key'] == 'spreads')
         assert(len(market['outcomes']) == 2)
         lines = {}
         for outcome in market['outcomes']:
             assert(outcome['name'] in teams)
-            lines[prefix+LineGenerator.tchar(outcome['name'], teams)+'_price'] = outcome['price']
-            lines[prefix+LineGenerator.tchar(outcome['name'], teams)+'_point'] = outcome['point']
-        return lines
+            lines[LineGenerator.tchar(outcome['name'], teams)] = (outcome['price'], outcome['point'])
+        return lines['H'] + lines['A']
 
-    def process_total(prefix, market):
+    def process_total(market):
         assert(market['key'] == 'totals')
         assert(len(market['outcomes']) == 2)
-        lines = {}
         for outcome in market['outcomes']:
             assert(outcome['name'] in ('Over', 'Under'))
-            lines[prefix+LineGenerator.ochar(outcome['name'])+'_price'] = outcome['price']
-            lines[prefix+LineGenerator.ochar(outcome['name'])+'_point'] = outcome['point']
-        return lines
+            values = (outcome['price'], outcome['point'])
+        return values
 
     # Sends get request to the api
+    # event_ids (set) - only query the odds of these events, every event if None.
     # Returns raw response, unformatted.
-    def query(self):
+    # In stream mode, returns an iterator over the games of the response that
+    # decodes the body as it's downloaded.
+    def query(self, event_ids=None):
+        params = {
+            'markets': self.params['MARKETS'],
+            'oddsFormat': self.params['ODDS_FORMAT'],
+            'dateFormat': self.params['DATE_FORMAT']
+        }
+        if self.bookmakers:
+            params['bookmakers'] = self.params['BOOKMAKERS']
+        else:
+            params['regions'] = self.params['REGIONS']
+        if event_ids is not None:
+            params['eventIds'] = ','.join(sorted(event_ids))
         # Send request to the api and get back a response
-        response = requests.get(
-                       f"https://api.the-odds-api.com/v4/sports/{self.params['SPORT']}/odds",
-                       params={
-                           'api_key': self.key,
-                           'regions': self.params['REGIONS'],
-                           'markets': self.params['MARKETS'],
-                           'oddsFormat': self.params['ODDS_FORMAT'],
-                           'dateFormat': self.params['DATE_FORMAT']
-                       })
+        response = self.client.get(f"/sports/{self.params['SPORT']}/odds", params,
+                                   stream=self.stream)
         # Update usage stats
         self.update_usage(response.headers['x-requests-remaining'],
                           response.headers['x-requests-used'])
+        if self.stream:
+            return self.record(LineGenerator.iter_games(
+                                   self.client.iter_content(response, LineGenerator.chunk_size)))
         # Return raw response
+        data = response.json()
+        if self.recorder:
+            self.recorder.record('lines', {'response': data,
+                                           'remaining': self.remaining,
+                                           'used': self.used})
+        return data
+
+    # Passes the streamed games through, and records the response once it's
+    # fully read, if recording.
+    def record(self, games):
+        if not self.recorder:
+            yield from games
+            return
+        data = []
+        for game in games:
+            data.append(game)
+            yield game
+        self.recorder.record('lines', {'response': data,
+                                       'remaining': self.remaining,
+                                       'used': self.used})
+
+    # Bytes read from the response at a time, in stream mode.
+    chunk_size = 64*1024
+
+    # Decodes a json array of games from a stream of byte chunks, yielding
+    # each game once its closing brace has arrived.
+    # Only one game, and the chunk it ends in, are held in memory at a time.
+    def iter_games(chunks):
+        decoder = json.JSONDecoder()
+        text = codecs.getincrementaldecoder('utf-8')()
+        buffer, pos = '', 0
+        started, finished = False, False
+        for chunk in chunks:
+            buffer = buffer[pos:] + text.decode(chunk)
+            pos = 0
+            while not finished:
+                # Skip whitespace and separators
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                if not started:
+                    # The api returns an object, not an array, on errors.
+                    assert(buffer[pos] == '['), buffer[:200]
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == ']':
+                    finished = True
+                    break
+                try:
+                    game, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # The game isn't fully downloaded yet.
+                    break
+                pos = end
+                yield game
+        if not finished:
+            raise ValueError('Incomplete odds api response')
+
+    # Sends get request to the api's events endpoint, which doesn't count
+    # against the usage quota.
+    # Returns raw response, the events without odds.
+    def query_events(self):
+        response = self.client.get(f"/sports/{self.params['SPORT']}/events",
+                                   {'dateFormat': self.params['DATE_FORMAT']})
         return response.json()
 
+    # Returns the id prefix and start time of an api event, cached by event id.
+    def event_info(self, event):
+        cached = self.events.get(event['id'])
+        if cached and cached[0] == event['commence_time']:
+            return cached[1], cached[2]
+        start = self.eastern(event['commence_time'])
+        id_prefix = self.get_id_prefix(event['home_team'], strt_time=start)
+        self.events[event['id']] = (event['commence_time'], id_prefix, start)
+        return id_prefix, start
+
+    # Refreshes the event id mapping from the events endpoint.
+    def refresh_events(self, nowtime):
+        events = self.query_events()
+        self.events = {event['id']: self.events[event['id']] for event in events
+                           if event['id'] in self.events}
+        for event in events:
+            self.event_info(event)
+        self.events_at = nowtime
+
+    # Returns the ids of the events to query the odds of. Those of the given
+    # game id prefixes and any game that's active.
+    # The event mapping is refreshed hourly, or every 5 minutes while a
+    # prefix is missing from it.
+    def scope(self, prefixes, nowtime):
+        age = (nowtime - self.events_at).total_seconds() if self.events_at else None
+        known = {prefix for _, prefix, _ in self.events.values()}
+        if age is None or age > 3600 or (not prefixes <= known and age > 300):
+            self.refresh_events(nowtime)
+        return {id for id, (_, prefix, start) in self.events.items()
+                    if prefix in prefixes or LineGenerator.is_active(start, nowtime)}
+
+    # Whether a game starting at start is live or about to start.
+    def is_active(start, nowtime):
+        return start - LineGenerator.lead_time <= nowtime <= start + LineGenerator.game_time
 
     # Takes raw response from the api and formats it.
-    def format_response(self, response):
+    # response (iterable) - the games of the response, a list or a stream.
+    # active_only (bool)  - only format the lines of active games, the other
+    #                       games are listed with their start time and no lines.
+    # ids (set)           - if set, the event ids of the response are added to it.
+    # prefixes (set)      - id prefixes of the live games, active whatever
+    #                       their start time, e.g. after a rain delay.
+    def format_response(self, response, active_only=False, ids=None, prefixes=frozenset()):
         games = {}
+        nowtime = self.clock.now(pytz.utc)
         for game in response:
-            start = LineGenerator.to_eastern(game['commence_time'])
-            teams = (game['away_team'], game['home_team'])
-            id_prefix = self.get_id_prefix(teams[1], strt_time=start)
-            line_info = {}
-            for book in game['bookmakers']:
-                bpre = book['key']+'_'
-                line_info[bpre+'last'] = LineGenerator.to_eastern(book['last_update'])
-                for market in book['markets']:
-                    mpre = bpre + market['key']+'_'
-                    line_info[mpre+'last'] = LineGenerator.to_eastern(market['last_update'])
-                    if market['key'] == 'h2h':
-                        line_info.update(LineGenerator.process_moneyline(mpre, market, teams))
-                    if market['key'] == 'spreads':
-                        line_info.update(LineGenerator.process_spread(mpre, market, teams))
-                    if market['key'] == 'totals':
-                        line_info.update(LineGenerator.process_total(mpre, market))
-            games[id_prefix] = (start, pd.Series(line_info))
+            id_prefix, start, lines = self.format_game(game, nowtime, active_only, prefixes)
+            games[id_prefix] = (start, lines)
+            if ids is not None:
+                ids.add(game['id'])
         return games
 
+    # Formats a single game of the response.
+    # Returns (id prefix, start time, LineSnapshot or None if not active)
+    def format_game(self, game, nowtime, active_only=False, prefixes=frozenset()):
+        self.convert_times((game,))
+        times = self.times
+        teams = (game['away_team'], game['home_team'])
+        id_prefix, start = self.event_info(game)
+        if (active_only and not id_prefix in prefixes
+                and not LineGenerator.is_active(start, nowtime)):
+            return id_prefix, start, None
+        lines = []
+        for book in game['bookmakers']:
+            if self.bookmakers and not book['key'] in self.bookmakers:
+                continue
+            book_last = times[book['last_update']][1]
+            for market in book['markets']:
+                if market['key'] == 'h2h':
+                    values = LineGenerator.process_moneyline(market, teams)
+                elif market['key'] == 'spreads':
+                    values = LineGenerator.process_spread(market, teams)
+                elif market['key'] == 'totals':
+                    values = LineGenerator.process_total(market)
+                else:
+                    continue
+                lines.append(MarketLine(book['key'], book_last, market['key'],
+                                        times[market['last_update']][1],
+                                        values,
+                                        market['outcomes'][0]['name'] == game['away_team']))
+        return id_prefix, start, LineSnapshot(tuple(lines))
+
+    # Seconds until the odds api quota resets, on the first of the month.
+    def quota_secs(nowtime):
+        reset = (nowtime.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                 + datetime.timedelta(days=32)).replace(day=1)
+        return (reset - nowtime).total_seconds()
+
+    # Seconds of active games left today, from the start times of the cached lines.
+    def active_secs(self, nowtime):
+        tz = pytz.timezone('US/Pacific')
+        nowtime = nowtime.astimezone(tz)
+        midnight = tz.normalize(nowtime.replace(hour=0, minute=0, second=0, microsecond=0)
+                                + datetime.timedelta(days=1))
+        windows = sorted((max(start - LineGenerator.lead_time, nowtime),
+                          min(start + LineGenerator.game_time, midnight))
+                         for start, _ in self.cached.values())
+        secs, end = 0, nowtime
+        for lo, hi in windows:
+            lo = max(lo, end)
+            if hi > lo:
+                secs += (hi - lo).total_seconds()
+                end = hi
+        return secs
+
+    # Budget planner.
+    # Returns the seconds the cached lines are reused for, spreading today's
+    # share of the remaining requests over the active game time left today.
+    def budget_ttl(self, nowtime):
+        if self.remaining < 0:
+            return self.ttl
+        if self.remaining == 0:
+            return LineGenerator.quota_secs(nowtime)
+        days = max(LineGenerator.quota_secs(nowtime) / 86400, 1)
+        queries = max(self.remaining / self.cost / days, 1)
+        return max(self.ttl, self.active_secs(nowtime) / queries)
+
+    # Returns the seconds the cached lines are reused for, or None if there
+    # are no cached lines, or they lack the lines of a live game.
+    # prefixes (set) - id prefixes of the live games.
+    def cache_ttl(self, nowtime, prefixes=frozenset()):
+        if self.cached is None:
+            return None
+        if any(prefix in self.cached and self.cached[prefix][1] is None for prefix in prefixes):
+            return None
+        if (any(prefix in self.cached for prefix in prefixes) or
+                any(LineGenerator.is_active(start, nowtime) for start, _ in self.cached.values())):
+            return self.budget_ttl(nowtime)
+        return self.idle_ttl
+
+    # Queries the api and returns the formatted response.
+    # Within the cache ttl the last formatted response is returned instead.
+    # prefixes (set) - id prefixes of the live games, the odds of these and of
+    #                  any game about to start are queried in scoped mode.
+    # Returns a dictionary game_id_prefix -> (commence_time, LineSnapshot)
+    #                                        (commence_time, None) for inactive games
+    #                                        if a ttl is set, or for the games
+    #                                        out of scope in scoped mode.
+    # If the api can't be reached, the last good lines are returned.
+    def get_lines(self, prefixes=frozenset()):
+        try:
+            lines = self.fetch_lines(prefixes)
+        except (requests.RequestException, CircuitOpen, ValueError) as error:
+            self.fallbacks += 1
+            print(f'--> Odds api unavailable, using the last good lines: {error!r}')
+            return self.last_good if self.last_good is not None else {}
+        self.last_good = lines
+        return lines
+
+    def fetch_lines(self, prefixes):
+        nowtime = self.clock.now(pytz.utc)
+        scope = self.scope(prefixes, nowtime) if self.scoped else None
+        ttl = self.cache_ttl(nowtime, prefixes)
+        if (ttl is not None and (nowtime - self.cached_at).total_seconds() < ttl
+                and (self.cached_scope is None or scope <= self.cached_scope)):
+            self.hits += 1
+            return self.cached
+        # Nothing in scope, list the known games without lines.
+        if scope is not None and not scope:
+            return {prefix: (start, None) for _, prefix, start in self.events.values()}
+        remaining = self.remaining
+        response = self.query(scope)
+        self.queries += 1
+        if 0 <= self.remaining < remaining:
+            self.cost = remaining - self.remaining
+        ids = set()
+        if not self.ttl and not self.idle_ttl:
+            lines = self.format_response(response, ids=ids)
+        else:
+            lines = self.format_response(response, active_only=True, ids=ids, prefixes=prefixes)
+            self.cached = lines
+            self.cached_at = nowtime
+            self.cached_scope = scope
+        # A full response lists every event, drop the finished ones.
+        if scope is None:
+            self.events = {id: event for id, event in self.events.items() if id in ids}
+        # Games out of scope are listed with their start time.
+        if scope is not None:
+            for id, (_, prefix, start) in self.events.items():
+                if not id in scope and not prefix in lines:
+                    lines[prefix] = (start, None)
+        return lines
 
-    # Queries the api and returns the formatted response
-    # Returns a dictionary game_id_prefix -> (commence_time, pd.series of line info)
-    def get_lines(self):
-        return self.format_response(self.query())
+    # Returns cache and api client statistics
+    def metrics(self):
+        return {'queries': self.queries,
+                'cache_hits': self.hits,
+                'fallbacks': self.fallbacks,
+                'requests_per_query': self.cost,
+                'client': self.client.metrics()}
 
     # Returns usage stats
     def usage(self):
@@ -0,0 +1,118 @@
+# External imports
+import sys
+
+# Odds of one market at one bookmaker.
+#
+# values are in the order of the market's fields, which match the value
+# columns of the market's table in the database.
+# Last update times are carried as eastern time strings, formatted once per
+# distinct api time string, e.g. '2023-03-30 16:05:00-04:00'. Their first 19
+# characters are the database's format.
+# The csv columns of h2h and spreads follow the api's outcome order, so
+# away_first is kept for them.
+class MarketLine:
+    __slots__ = ('bookmaker', 'book_last', 'market', 'last', 'values', 'away_first')
+
+    # Value fields of each market.
+    # Note: Both totals outcomes are stored as U, the last one listed wins.
+    fields = {
+        'h2h':     ('H_price', 'A_price'),
+        'spreads': ('H_price', 'H_point', 'A_price', 'A_point'),
+        'totals':  ('U_price', 'U_point')
+    }
+
+    # Indices of the values in the csv column order, when the away team's
+    # outcome is listed first.
+    away_order = {
+        'h2h':     (1, 0),
+        'spreads': (2, 3, 0, 1)
+    }
+
+    # bookmaker (str)          - bookmaker key, e.g. 'fanduel'
+    # book_last (str)          - last update of the bookmaker
+    # market (str)             - 'h2h', 'spreads' or 'totals'
+    # last (str)               - last update of the market
+    # values (tuple)           - see fields
+    # away_first (bool)        - if the api listed the away outcome first.
+    def __init__(self, bookmaker, book_last, market, last, values, away_first=False):
+        self.bookmaker = bookmaker
+        self.book_last = book_last
+        self.market = market
+        self.last = last
+        self.values = values
+        self.away_first = away_first
+
+    def __eq__(self, other):
+        return (isinstance(other, MarketLine) and
+                self.bookmaker == other.bookmaker and
+                self.market == other.market and
+                self.last == other.last and
+                self.values == other.values)
+
+    def __hash__(self):
+        return hash((self.bookmaker, self.market, self.last, self.values))
+
+    # Last update of the market, in the database's format.
+    def last_db(self):
+        return self.last[:19]
+
+    # Returns the row of the line, keyed by the legacy column names.
+    # e.g. {'fanduel_h2h_last': ..., 'fanduel_h2h_H_price': ..., ...}
+    def columns(self):
+        mpre = self.bookmaker+'_'+self.market+'_'
+        row = {mpre+'last': self.last}
+        fields = MarketLine.fields[self.market]
+        order = MarketLine.away_order[self.market] if self.away_first else range(len(fields))
+        for i in order:
+            row[mpre+fields[i]] = self.values[i]
+        return row
+
+# Lines of one game, as listed by the odds api at one time.
+# Read only, shared by every iteration that reuses the same api response.
+class LineSnapshot:
+    __slots__ = ('lines',)
+
+    # lines (tuple) - MarketLines, in response order.
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    # Returns the lines of the given bookmaker.
+    def bookmaker(self, key):
+        return [line for line in self.lines if line.bookmaker == key]
+
+    # Returns the snapshot as a row dict with the legacy column names,
+    # e.g. 'draftkings_last', 'draftkings_spreads_H_point'.
+    # Used for the csv files.
+    def to_row(self, timestamp=None):
+        row = {}
+        for line in self.lines:
+            row[line.bookmaker+'_last'] = line.book_last
+            row.update(line.columns())
+        if timestamp is not None:
+            row['timestamp'] = timestamp
+        return row
+
+    # Approximate bytes retained by the snapshot.
+    # Datetimes and strings shared between lines are counted once.
+    def nbytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.lines)
+        seen = set()
+        for line in self.lines:
+            size += sys.getsizeof(line) + sys.getsizeof(line.values)
+            for obj in (line.bookmaker, line.book_last, line.last) + line.values:
+                if id(obj) not in seen:
+                    seen.add(id(obj))
+                    size += sys.getsizeof(obj)
+        return size
+
+    def __str__(self):
+        return '\n'.join(f'{line.bookmaker} {line.market} ' +
+                         ' '.join(f'{field}={value}' for field, value in
+                                  zip(MarketLine.fields[line.market], line.values))
+                         for line in self.lines)
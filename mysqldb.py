@@ -1,20 +1,61 @@
-import pandas as pd
-
 from dumper import Dumper
+from linesnapshot import MarketLine
 
 import mysql.connector
+import mysql.connector.pooling
+import threading
+import time
 
+# Dumps rows to the MySQL database.
+#
+# Rows are gathered as they're dumped, and written by commit() with one
+# multi-row insert per table, in a single transaction. The scraper commits
+# once per iteration.
+# Connections come from a pool, and are pinged before each commit so
+# connections the server dropped while idle are reopened.
 class Database(Dumper):
-    def __init__(self, host, user, password, db_name, port=3306):
+    # pool_size (int)  - pooled connections, one per concurrent commit or query.
+    # retries (int)    - times a failed commit is retried on a fresh connection.
+    # max_rows (int)   - gathered rows that trigger a commit without waiting
+    #                    for the end of the iteration.
+    def __init__(self, host, user, password, db_name, port=3306, pool_size=2,
+                 retries=1, max_rows=5000):
         # Connect to the given MySQL database
-        self.connection = mysql.connector.connect(host=host,
-                                                  user=user,
-                                                  password=password,
-                                                  port=port,
-                                                  database=db_name)
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(pool_name='scraper',
+                                                                pool_size=pool_size,
+                                                                host=host,
+                                                                user=user,
+                                                                password=password,
+                                                                port=port,
+                                                                database=db_name)
+        self.retries = retries
+        self.max_rows = max_rows
+        # Maps: insert command -> [rows], in dump order.
+        self.batches = {}
+        self.rows = 0
+        self.lock = threading.Lock()
+        # Metrics
+        self.commits = 0
+        self.committed = 0
+        self.failures = 0
+        self.commit_secs = 0
+        self.max_commit_secs = 0
+        self.last_commit_rows = 0
         # Log the connection
         print('--> Connected to the database:')
-        print(self.connection)
+        print(f'{user}@{host}:{port}/{db_name}, {pool_size} pooled connections')
+
+    # Returns a pooled connection, reconnecting it if the server dropped it.
+    # Closing the connection returns it to the pool, so it's closed here if it
+    # can't be reconnected, or the pool would run out after enough outages.
+    def connect(self):
+        connection = self.pool.get_connection()
+        try:
+            connection.ping(reconnect=True, attempts=3, delay=1)
+        except:
+            connection.close()
+            raise
+        return connection
 
     # MySQL command templates
     sql_insert_state_cmd = """
@@ -42,8 +83,16 @@ class Database(Dumper):
         VALUES (%s, %s, %s, %s, %s, %s)
     """
 
+    # Gathers the row, commits if max_rows are gathered.
+    def gather(self, cmd, row):
+        with self.lock:
+            self.batches.setdefault(cmd, []).append(row)
+            self.rows += 1
+            full = self.rows >= self.max_rows
+        if full:
+            self.commit()
+
     def dump_state(self, game):
-       cursor = self.connection.cursor()
        val = (
          game.id,
          game.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
@@ -60,64 +109,104 @@ class Database(Dumper):
          game.count[0],
          game.count[1]
        )
-       cursor.execute(Database.sql_insert_state_cmd, val)
-       self.connection.commit()
-
-    # Helper function for grouping columns by bet type
-    def get_bet_type(name):
-        bet_types = ('h2h', 'spreads', 'totals')
-        for bt in bet_types:
-            if bt in name:
-                return bt
-        return 'NA'
-
-
-    def dump_lines(self, game):
-       cursor = self.connection.cursor()
-       for _, book_grp in game.line_info.groupby(lambda name: name.split('_')[0]): # Group cols by bookmaker
-                for bet, bet_grp in book_grp.groupby(Database.get_bet_type): # Group bookmaker cols by bet type
-                    if bet == 'NA':
-                        continue
-                    # Get bookmaker id
-                    bookmaker = bet_grp.keys()[0].split('_'+bet)[0]
-                    # Construct sql cmd and values depending on bet type
-                    if bet == 'h2h':
-                        cmd = Database.sql_insert_h2h_cmd
-                        vals = (
-                                     game.id,
-                                     bookmaker,
-                                     game.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                                     pd.to_datetime(game.line_info[bookmaker+'_h2h_last']).strftime('%Y-%m-%d %H:%M:%S'),
-                                     game.line_info[bookmaker+'_h2h_H_price'],
-                                     game.line_info[bookmaker+'_h2h_A_price']
-                        )
-                    elif bet == 'spreads':
-                        cmd = Database.sql_insert_spreads_cmd
-                        vals = (
-                                     game.id,
-                                     bookmaker,
-                                     game.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                                     pd.to_datetime(game.line_info[bookmaker+'_spreads_last']).strftime('%Y-%m-%d %H:%M:%S'),
-                                     game.line_info[bookmaker+'_spreads_H_price'],
-                                     game.line_info[bookmaker+'_spreads_H_point'],
-                                     game.line_info[bookmaker+'_spreads_A_price'],
-                                     game.line_info[bookmaker+'_spreads_A_point']
-                        )
-                    elif bet == 'totals':
-                        cmd = Database.sql_insert_totals_cmd
-                        vals = (
-                                     game.id,
-                                     bookmaker,
-                                     game.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                                     pd.to_datetime(game.line_info[bookmaker+'_totals_last']).strftime('%Y-%m-%d %H:%M:%S'),
-                                     game.line_info[bookmaker+'_totals_U_price'],
-                                     game.line_info[bookmaker+'_totals_U_point']
-                        )
-                    else:
-                        continue
-                # Exclude null values
-                if bet_grp.isnull().values.any():
-                    continue
-                # Write out the values to the database
-                cursor.execute(cmd, vals)
-                self.connection.commit()
+       self.gather(Database.sql_insert_state_cmd, val)
+
+    # Insert command of each market
+    sql_insert_lines_cmds = {
+        'h2h':     sql_insert_h2h_cmd,
+        'spreads': sql_insert_spreads_cmd,
+        'totals':  sql_insert_totals_cmd
+    }
+
+    # lines (LineSnapshot) - markets to insert, all of the game's if None.
+    def dump_lines(self, game, lines=None):
+       timestamp = game.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+       for line in (lines if lines is not None else game.line_info):
+           # Exclude null values
+           if None in line.values:
+               continue
+           vals = (game.id, line.bookmaker, timestamp, line.last_db()) + line.values
+           self.gather(Database.sql_insert_lines_cmds[line.market], vals)
+
+    # Writes out the gathered rows in one transaction.
+    # If every try fails, the rows are kept for the next commit and the last
+    # error is raised.
+    def commit(self):
+       with self.lock:
+           batches, self.batches = self.batches, {}
+           rows, self.rows = self.rows, 0
+           if not rows:
+               return
+           start = time.monotonic()
+           for attempt in range(self.retries + 1):
+               try:
+                   connection = self.connect()
+               except mysql.connector.Error:
+                   self.failures += 1
+                   if attempt < self.retries:
+                       continue
+                   self.restore(batches, rows)
+                   raise
+               try:
+                   cursor = connection.cursor()
+                   for cmd, vals in batches.items():
+                       cursor.executemany(cmd, vals)
+                   connection.commit()
+                   break
+               except mysql.connector.Error:
+                   self.failures += 1
+                   try:
+                       connection.rollback()
+                   except mysql.connector.Error:
+                       pass
+                   if attempt == self.retries:
+                       self.restore(batches, rows)
+                       raise
+               finally:
+                   connection.close()
+           commit_secs = time.monotonic() - start
+           self.commits += 1
+           self.committed += rows
+           self.last_commit_rows = rows
+           self.commit_secs += commit_secs
+           self.max_commit_secs = max(self.max_commit_secs, commit_secs)
+
+    # Puts the rows of a failed commit back ahead of the rows gathered since.
+    # Called holding self.lock.
+    def restore(self, batches, rows):
+       for cmd, vals in self.batches.items():
+           batches.setdefault(cmd, []).extend(vals)
+       self.batches = batches
+       self.rows += rows
+
+    def flush(self):
+       self.commit()
+
+    def metrics(self):
+       with self.lock:
+           return {'pending_rows': self.rows,
+                   'commits': self.commits,
+                   'committed_rows': self.committed,
+                   'last_commit_rows': self.last_commit_rows,
+                   'failures': self.failures,
+                   'mean_commit_secs': self.commit_secs / self.commits if self.commits else None,
+                   'max_commit_secs': self.max_commit_secs}
+
+    # Returns the last row of each (game, bookmaker, market) written since
+    # the given time, to warm a LineFilter with.
+    # Returns a list of (game id, bookmaker, market, last update, values)
+    def last_lines(self, since):
+       connection = self.connect()
+       rows = {}
+       try:
+           cursor = connection.cursor()
+           for market, fields in MarketLine.fields.items():
+               cursor.execute(f"""
+                   SELECT game_id, bookmaker, last, {', '.join(fields)} FROM {market}
+                   WHERE timestamp >= %s ORDER BY id
+               """, (since.strftime('%Y-%m-%d %H:%M:%S'),))
+               for row in cursor.fetchall():
+                   rows[(row[0], row[1], market)] = (row[0], row[1], market, row[2], tuple(row[3:]))
+       finally:
+           connection.close()
+       return list(rows.values())
@@ -0,0 +1,152 @@
+# External imports
+import random
+import requests
+import threading
+import time
+import urllib3
+
+class CircuitOpen(Exception):
+    pass
+
+# HTTP client for the odds api.
+#
+# Keeps a pooled keep-alive session, asks for every compression urllib3 can
+# decode (gzip, deflate, and brotli/zstd when their modules are installed),
+# and bounds every request with connect and read timeouts.
+# Failed requests are retried with jittered exponential backoff. After
+# max_failures failed requests in a row the circuit opens, and requests fail
+# fast with CircuitOpen until cooldown seconds have passed.
+class OddsClient:
+    base_url = 'https://api.the-odds-api.com/v4'
+
+    # Statuses worth retrying, the others are the request's fault.
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    # key (str)            - odds api key
+    # timeout (tuple)      - connect and read timeouts in seconds. The read
+    #                        timeout bounds each wait for data, not the whole body.
+    # retries (int)        - retries per request, after the first attempt.
+    # backoff (float)      - base backoff in seconds, doubled every retry and
+    #                        jittered between 0 and the doubled value.
+    # max_failures (int)   - consecutive failed requests that open the circuit.
+    # cooldown (float)     - seconds the circuit stays open.
+    # sleep (function)     - sleeps between retries, e.g. a clock's sleep.
+    def __init__(self, key, base_url=None, timeout=(5, 20), retries=2, backoff=1,
+                 max_failures=3, cooldown=300, sleep=time.sleep):
+        self.key = key
+        self.base_url = base_url if base_url else OddsClient.base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.sleep = sleep
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update(urllib3.util.make_headers(accept_encoding=True, keep_alive=True))
+        # Circuit breaker
+        self.failures = 0
+        self.opened_at = None
+        # Metrics
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retried = 0
+        self.rejected = 0
+        self.latency_secs = 0
+        self.max_latency_secs = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+
+    def circuit_open(self):
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            # Half open, the next request decides.
+            self.opened_at = None
+            self.failures = self.max_failures - 1
+            return False
+        return True
+
+    # Sends a get request to the api path, e.g. '/sports/baseball_mlb/odds'.
+    # Returns the requests.Response, with its body unread if stream is set.
+    # Raises CircuitOpen while the circuit is open, or the last error once the
+    # retries are used up.
+    def get(self, path, params, stream=False):
+        if self.circuit_open():
+            with self.lock:
+                self.rejected += 1
+            raise CircuitOpen(f'odds api circuit open after {self.failures} failures')
+        params = dict(params, api_key=self.key)
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            try:
+                response = self.session.get(self.base_url + path, params=params,
+                                            timeout=self.timeout, stream=stream)
+                if response.status_code in OddsClient.retry_statuses:
+                    response.close()
+                    raise requests.HTTPError(f'{response.status_code} from the odds api',
+                                             response=response)
+                response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+                with self.lock:
+                    self.requests += 1
+                    self.errors += 1
+                status = error.response.status_code if error.response is not None else None
+                if (status is not None and status not in OddsClient.retry_statuses
+                        or attempt == self.retries):
+                    self.fail()
+                    raise
+                with self.lock:
+                    self.retried += 1
+                self.sleep(random.uniform(0, self.backoff * 2**attempt))
+                continue
+            self.failures = 0
+            with self.lock:
+                self.requests += 1
+                latency = time.monotonic() - start
+                self.latency_secs += latency
+                self.max_latency_secs = max(self.max_latency_secs, latency)
+            if not stream:
+                self.observe(response, len(response.content))
+            return response
+
+    # Records a failed request, opening the circuit after max_failures in a row.
+    def fail(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+    # Records the bytes of a fully read response.
+    def observe(self, response, body_bytes):
+        with self.lock:
+            # Bytes read off the wire, before decompression.
+            self.wire_bytes += response.raw.tell()
+            self.body_bytes += body_bytes
+
+    # Yields the decompressed body of a streamed response in chunks, and
+    # records its bytes once it's fully read.
+    def iter_content(self, response, chunk_size):
+        size = 0
+        with response:
+            for chunk in response.iter_content(chunk_size):
+                size += len(chunk)
+                yield chunk
+            self.observe(response, size)
+
+    def metrics(self):
+        with self.lock:
+            ok = self.requests - self.errors
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retried,
+                'rejected': self.rejected,
+                'circuit_open': self.opened_at is not None,
+                # Time to the response headers
+                'mean_latency_secs': self.latency_secs / ok if ok else None,
+                'max_latency_secs': self.max_latency_secs,
+                'wire_bytes': self.wire_bytes,
+                'body_bytes': self.body_bytes
+            }
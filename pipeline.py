@@ -0,0 +1,317 @@
+# External imports
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
+import traceback
+
+# Internal imports
+from dumper import Dumper
+
+# Immutable copy of the fields of a GameState the dumpers read.
+# Games keep being updated by the scraper while their rows wait in the queue.
+class GameSnapshot:
+    __slots__ = ('id', 'timestamp', 'inning', 'is_bot', 'outs', 'score',
+                 'runners', 'batter', 'pitcher', 'count', 'line_info')
+
+    def __init__(self, game, lines=False):
+        for name in GameSnapshot.__slots__:
+            object.__setattr__(self, name, getattr(game, name))
+        object.__setattr__(self, 'score', tuple(game.score))
+        object.__setattr__(self, 'runners', tuple(game.runners))
+        object.__setattr__(self, 'count', tuple(game.count))
+        # Only lines rows carry the lines. Line snapshots are read only, so
+        # they're shared rather than copied.
+        object.__setattr__(self, 'line_info', game.line_info if lines else None)
+
+    def __setattr__(self, name, value):
+        assert(False) # Snapshots are immutable
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in GameSnapshot.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(GameSnapshot.__slots__, state):
+            object.__setattr__(self, name, value)
+
+# One writer thread, its bounded queue, and its spill segments.
+class WriteShard:
+    def __init__(self, pipeline, idx):
+        self.pipeline = pipeline
+        self.idx = idx
+        self.queue = queue.Queue(maxsize=pipeline.maxsize)
+        # Rows enqueued and not yet written or dropped.
+        self.pending = 0
+        self.cond = threading.Condition()
+        # Spill segment files, oldest first. Rows are appended to the last one.
+        # Once a shard spills, every row goes to the segments until they're
+        # drained, so rows are written in the order they were enqueued.
+        self.segments = []
+        self.spill_file = None
+        self.thread = threading.Thread(target=self.run, name=f'writer-{idx}', daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        with self.cond:
+            self.pending += 1
+        mode = self.pipeline.backpressure
+        if mode == 'block':
+            self.queue.put(item)
+        elif mode == 'drop-oldest':
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+                try:
+                    dropped = self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.pipeline.lost(dropped, 'dropped')
+                    self.done()
+                except queue.Empty:
+                    pass
+        else: # 'spill'
+            with self.cond:
+                if not self.segments:
+                    try:
+                        self.queue.put_nowait(item)
+                        return
+                    except queue.Full:
+                        pass
+                self.spill(item)
+
+    # Appends the row to the current spill segment. Called holding self.cond.
+    def spill(self, item):
+        if self.spill_file is None:
+            fd, path = tempfile.mkstemp(prefix=f'spill-{self.idx}-', suffix='.pkl',
+                                        dir=self.pipeline.spill_path)
+            self.spill_file = os.fdopen(fd, 'wb')
+            self.segments.append(path)
+        pickle.dump(item, self.spill_file)
+        self.pipeline.count('spilled')
+
+    # Takes the oldest spill segment, once the queue is drained.
+    # Returns None if there are no segments.
+    def take_segment(self):
+        with self.cond:
+            if not self.segments:
+                return None
+            path = self.segments[0]
+            # New rows go to a new segment while this one is written.
+            if len(self.segments) == 1 and self.spill_file:
+                self.spill_file.close()
+                self.spill_file = None
+            return path
+
+    def drain_segment(self, path):
+        with open(path, 'rb') as file:
+            while True:
+                try:
+                    item = pickle.load(file)
+                except EOFError:
+                    break
+                self.write(item)
+        os.remove(path)
+        with self.cond:
+            self.segments.pop(0)
+
+    def done(self):
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+
+    def write(self, item):
+        kind, snapshot, lines, enqueued = item
+        if kind == 'commit':
+            self.commit()
+            return
+        start = time.monotonic()
+        try:
+            if kind == 'state':
+                self.pipeline.dumper.dump_state(snapshot)
+            else:
+                self.pipeline.dumper.dump_lines(snapshot, lines)
+        except Exception:
+            self.pipeline.lost(item, 'errors')
+            print(f'--> Writer {self.idx} failed to dump {kind} of {snapshot.id}:')
+            traceback.print_exc()
+        else:
+            # Only written rows count towards the write and latency figures.
+            finish = time.monotonic()
+            self.pipeline.observe(finish - start, finish - enqueued)
+        self.done()
+
+    # Commits the rows written so far, at the end of an iteration's rows.
+    def commit(self):
+        try:
+            self.pipeline.dumper.commit()
+        except Exception:
+            self.pipeline.count('errors')
+            print(f'--> Writer {self.idx} failed to commit:')
+            traceback.print_exc()
+        self.done()
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                path = self.take_segment()
+                if path:
+                    self.drain_segment(path)
+                continue
+            if item is None:
+                self.queue.task_done()
+                return
+            self.write(item)
+            self.queue.task_done()
+
+    # Blocks until every row enqueued so far is written or dropped.
+    def flush(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending == 0)
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def depth(self):
+        return self.queue.qsize()
+
+# Dumper stage between the Scraper and the configured Dumper.
+#
+# dump_state() and dump_lines() enqueue an immutable snapshot of the game and
+# return, writer threads drain the queues into the wrapped dumper. Games are
+# sharded across writers by id, so each game's rows are written in order.
+#
+# dumper (Dumper)     - dumper the rows are written to. With more than one
+#                       writer it's called from several threads at once, so
+#                       use a single writer for the MySQL Database.
+# writers (int)       - number of writer threads.
+# maxsize (int)       - capacity of each writer's queue.
+# backpressure (str)  - what to do when a writer's queue is full,
+#                       'block'       - wait for room,
+#                       'drop-oldest' - drop the oldest queued row,
+#                       'spill'       - append the row to a file on disk.
+# spill_path (str)    - directory of the spill files.
+# on_lost (function)  - called with (game id, lines) for each lines row that
+#                       was dropped or failed to write, e.g. LineFilter.revert.
+class WritePipeline(Dumper):
+    backpressure_modes = ('block', 'drop-oldest', 'spill')
+
+    def __init__(self, dumper, writers=1, maxsize=1000, backpressure='block', spill_path=None,
+                 on_lost=None):
+        assert(backpressure in WritePipeline.backpressure_modes)
+        assert(writers > 0 and maxsize > 0)
+        self.dumper = dumper
+        self.on_lost = on_lost
+        self.maxsize = maxsize
+        self.backpressure = backpressure
+        self.spill_path = spill_path if spill_path else tempfile.gettempdir()
+        os.makedirs(self.spill_path, exist_ok=True)
+        # Metrics
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.write_secs = 0
+        self.max_write_secs = 0
+        self.latency_secs = 0
+        self.max_latency_secs = 0
+        self.shards = [WriteShard(self, idx) for idx in range(writers)]
+        self.closed = False
+
+    def shard(self, id):
+        # Game ids are strings, summing the bytes is stable across runs,
+        # unlike hash().
+        return self.shards[sum(id.encode()) % len(self.shards)]
+
+    def enqueue(self, kind, game, lines=None):
+        assert(not self.closed)
+        snapshot = GameSnapshot(game, lines=(kind == 'lines'))
+        shard = self.shard(game.id)
+        shard.put((kind, snapshot, lines, time.monotonic()))
+        with self.lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, shard.depth())
+
+    def dump_state(self, game):
+        self.enqueue('state', game)
+
+    def dump_lines(self, game, lines=None):
+        self.enqueue('lines', game, lines)
+
+    # Queues a commit behind each writer's rows, so iterations are committed
+    # by the writers once their rows are written.
+    def commit(self):
+        assert(not self.closed)
+        for shard in self.shards:
+            shard.put(('commit', None, None, time.monotonic()))
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # Records a row that won't be written, counted under name.
+    # A dropped commit isn't a row, the next commit covers its rows.
+    def lost(self, item, name):
+        kind, snapshot, lines, _ = item
+        if kind == 'commit':
+            return
+        self.count(name)
+        if kind == 'lines' and self.on_lost:
+            self.on_lost(snapshot.id, lines if lines is not None else snapshot.line_info)
+
+    # Records a written row.
+    # write_secs   - time spent in the wrapped dumper.
+    # latency_secs - time from enqueue to written.
+    def observe(self, write_secs, latency_secs):
+        with self.lock:
+            self.written += 1
+            self.write_secs += write_secs
+            self.max_write_secs = max(self.max_write_secs, write_secs)
+            self.latency_secs += latency_secs
+            self.max_latency_secs = max(self.max_latency_secs, latency_secs)
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+        self.dumper.flush()
+
+    # Writes out every queued row, stops the writers, then closes the
+    # wrapped dumper.
+    def close(self):
+        if self.closed:
+            return
+        for shard in self.shards:
+            shard.close()
+        self.dumper.close()
+        self.closed = True
+
+    def metrics(self):
+        dumper = self.dumper.metrics()
+        with self.lock:
+            written = self.written
+            return {
+                'depth': sum(shard.depth() for shard in self.shards),
+                'max_depth': self.max_depth,
+                'spill_segments': sum(len(shard.segments) for shard in self.shards),
+                'enqueued': self.enqueued,
+                'written': written,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'errors': self.errors,
+                'mean_write_secs': self.write_secs / written if written else None,
+                'max_write_secs': self.max_write_secs,
+                'mean_latency_secs': self.latency_secs / written if written else None,
+                'max_latency_secs': self.max_latency_secs,
+                # Metrics of the wrapped dumper
+                'dumper': dumper
+            }
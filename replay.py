@@ -0,0 +1,220 @@
+# Record and replay of the scrape loop.
+#
+# A Recorder attached to the Soup and the LineGenerator saves every brew's game
+# soups and every odds api response during a production run. Replaying feeds
+# them back to a Scraper through ReplaySoup and ReplayLineGenerator, with a
+# VirtualClock in place of the wall clock, so a recorded day replays in seconds.
+#
+# Usage: python replay.py <recording> <outpath> [--lines data/response.json]
+
+# External imports
+import argparse
+import ast
+import bs4 as bs
+import bisect
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+# Internal imports
+from clock import VirtualClock
+from extractor import ParsedGame
+from lines import LineGenerator
+
+class Recorder:
+    # outpath (str) - directory the recordings are written to, one gzipped
+    #                 json lines file per run.
+    def __init__(self, outpath):
+        os.makedirs(outpath, exist_ok=True)
+        filename = datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.jsonl.gz'
+        self.path = os.path.join(outpath, filename)
+        self.file = gzip.open(self.path, 'at')
+        self.lock = threading.Lock()
+
+    # kind (str) - 'brew' or 'lines'
+    def record(self, kind, data):
+        line = json.dumps({'t': time.time(), 'kind': kind, 'data': data})
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# Returns the events of a recording, as (time, kind, data) sorted by time.
+# Runs ended by a signal or a crash leave the gzip stream without its end
+# marker, and maybe a partly written last line. The events flushed before
+# are kept.
+def load(path):
+    events = []
+    with gzip.open(path, 'rt') as file:
+        try:
+            for line in file:
+                if not line.endswith('\n'):
+                    break
+                event = json.loads(line)
+                events.append((event['t'], event['kind'], event['data']))
+        except EOFError:
+            pass
+    events.sort(key=lambda event: event[0])
+    return events
+
+# Loads a single raw odds api response, e.g. data/response.json.
+def load_response(path):
+    with open(path, 'r') as file:
+        text = file.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return ast.literal_eval(text)
+
+class ReplayFinished(Exception):
+    pass
+
+# Returns the data of the latest event at or before the clock's time.
+class ReplayTrack:
+    # Events are recorded during an iteration, shortly after the time the
+    # iteration started at, so they're matched up to this many seconds early.
+    slack = 5
+
+    # ends (bool) - whether running past the last event ends the replay.
+    def __init__(self, events, kind, clock, ends=True):
+        self.clock = clock
+        self.ends = ends
+        self.times = [t for t, k, _ in events if k == kind]
+        self.data = [data for _, k, data in events if k == kind]
+        self.served = -1
+
+    # Raises ReplayFinished once the clock is past the last event and it has
+    # already been served.
+    def current(self):
+        if not self.times:
+            return None
+        last = len(self.times) - 1
+        if self.ends and self.served == last and self.clock.time > self.times[last]:
+            raise ReplayFinished()
+        idx = max(bisect.bisect_right(self.times, self.clock.time + ReplayTrack.slack) - 1, 0)
+        self.served = idx
+        return self.data[idx]
+
+class ReplaySoup:
+    def __init__(self, events, clock, features='html.parser'):
+        self.track = ReplayTrack(events, 'brew', clock)
+        self.features = features
+
+    def brew(self, parsed=False):
+        records = [ParsedGame(bs.BeautifulSoup(html, self.features).div)
+                   for html in self.track.current()]
+        return records if parsed else [record.soup for record in records]
+
+    def open(self):
+        pass
+
+    def reload(self):
+        pass
+
+    def metrics(self):
+        return {}
+
+    def close(self):
+        pass
+
+class ReplayLineGenerator(LineGenerator):
+    # response (list) - static raw response used when the recording has no
+    #                   odds events, e.g. load_response('./data/response.json').
+    def __init__(self, events, clock, response=None, ttl=0, idle_ttl=0, scoped=False):
+        super().__init__(None, ttl=ttl, idle_ttl=idle_ttl, clock=clock, scoped=scoped)
+        # The replay ends with the last brew, not with the last odds response.
+        self.track = ReplayTrack(events, 'lines', clock, ends=False)
+        self.response = response
+
+    def query(self, event_ids=None):
+        event = self.track.current()
+        if event is None:
+            response = self.response if self.response is not None else []
+        else:
+            self.update_usage(event['remaining'], event['used'])
+            response = event['response']
+        if event_ids is None:
+            return response
+        return [game for game in response if game['id'] in event_ids]
+
+    # Events of the current response, without the odds.
+    def query_events(self):
+        event = self.track.current()
+        response = event['response'] if event else (self.response if self.response else [])
+        return [{key: game[key] for key in game if key != 'bookmakers'} for game in response]
+
+class ReplayAlert:
+    def alert(self, message):
+        pass
+
+if __name__ == '__main__':
+    from csvdumper import CSVDumper
+    from history import HistoryStore
+    from linefilter import LineFilter
+    from logger import Logger
+    from scraper import Scraper
+
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='Replay',
+                   description='Replays a recorded scrape run on a virtual clock')
+    parser.add_argument('recording')
+    parser.add_argument('outpath')
+    parser.add_argument('--lines', default=None,
+                        help='static odds api response, e.g. ./data/response.json')
+    parser.add_argument('--lines-ttl', type=int, default=0,
+                        help='seconds odds are cached for while games are active')
+    parser.add_argument('--lines-idle-ttl', type=int, default=0,
+                        help='seconds odds are cached for with no active games')
+    parser.add_argument('--lines-filter', action='store_true',
+                        help='only dump the lines markets that moved')
+    parser.add_argument('--lines-scoped', action='store_true',
+                        help='only query the odds of live and about to start games')
+    parser.add_argument('--history', type=int, default=0,
+                        help='states kept in memory per game, none if 0')
+    args = parser.parse_args()
+
+    events = load(args.recording)
+    assert(events)
+    clock = VirtualClock(events[0][0])
+    response = load_response(args.lines) if args.lines else None
+
+    # Replayed outputs, to diff against the production dumps.
+    for sub in ('states', 'lines', 'log'):
+        os.makedirs(os.path.join(args.outpath, sub), exist_ok=True)
+    bot = Scraper(CSVDumper(os.path.join(args.outpath, 'states'),
+                            os.path.join(args.outpath, 'lines')),
+                  ReplayLineGenerator(events, clock, response,
+                                      ttl=args.lines_ttl, idle_ttl=args.lines_idle_ttl,
+                                      scoped=args.lines_scoped),
+                  ReplayAlert(),
+                  Logger(os.path.join(args.outpath, 'log')),
+                  webpage=ReplaySoup(events, clock),
+                  clock=clock,
+                  linefilter=LineFilter() if args.lines_filter else None,
+                  history=HistoryStore(args.history) if args.history else None)
+
+    start = time.perf_counter()
+    try:
+        bot.scrape()
+    except ReplayFinished:
+        pass
+    wall = time.perf_counter() - start
+
+    iterations = clock.iterations
+    print(json.dumps({
+        'events': len(events),
+        'iterations': len(iterations),
+        'simulated_secs': clock.time - events[0][0],
+        'wall_secs': wall,
+        'iteration_secs_mean': sum(iterations) / len(iterations) if iterations else None,
+        'iteration_secs_max': max(iterations) if iterations else None,
+        'iterations_per_sec': len(iterations) / wall if wall else None,
+        'lines': bot.linegen.metrics(),
+        'history': bot.history.metrics() if bot.history else None
+    }, indent=2))
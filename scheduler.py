@@ -0,0 +1,110 @@
+# External imports
+import datetime
+import pytz
+
+# Picks the wait before the next scrape iteration.
+#
+# While games are live, each live game asks for a poll interval based on its
+# phase, and the shortest one wins:
+#   - at-bat with runners on, when scoring plays and steals happen - fast,
+#   - at-bat with the bases empty - normal,
+#   - mid/end of an inning, nothing happens until the next half starts - slow.
+# Every iteration queries the odds api once, so the interval is floored to
+# spread the remaining requests over the live hours left in the quota period.
+#
+# With no live games, it sleeps until the next listed start time, or until the
+# next morning when no games remain today.
+class PollScheduler:
+    # Poll intervals in seconds, by live game phase.
+    intervals = {
+        'runners': 20,
+        'at-bat': 45,
+        'break': 90
+    }
+
+    # Games that start later than listed are polled at this interval.
+    late_start_wait = 30
+    # Games are considered late for this long past their listed start time.
+    late_start_buffer = datetime.timedelta(minutes=30)
+    # Pregame games with no listed lines are polled at this interval.
+    pregame_wait = 30*60
+    # Hour of the next day to wake up at, when no games remain today.
+    wakeup_hour = 9
+
+    # Hours of live games per day the odds api quota is budgeted for.
+    live_hours = 10
+
+    # Waits longer than this reload the webpage after sleeping.
+    reload_after = 5*60
+
+    # clock (Clock)       - clock the scraper runs on.
+    # intervals (dict)    - poll intervals overriding the defaults.
+    def __init__(self, clock, intervals=None):
+        self.clock = clock
+        self.intervals = intervals if intervals else PollScheduler.intervals
+        # Requests used per iteration, a moving average. Iterations served
+        # from the LineGenerator's cache use none.
+        self.remaining = -1
+        self.cost = 1
+
+    # Phase of a live game, a key of intervals.
+    def phase(game):
+        if game.half in ('Mid', 'End'):
+            return 'break'
+        if any(game.runners):
+            return 'runners'
+        return 'at-bat'
+
+    # Live seconds left until the odds api quota resets, on the first of the month.
+    def quota_secs(self, nowtime):
+        reset = (nowtime.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                 + datetime.timedelta(days=32)).replace(day=1)
+        return (reset - nowtime).total_seconds() * PollScheduler.live_hours / 24
+
+    # Smallest interval that won't run out the odds api quota before it resets.
+    # Returns 0 if the remaining requests are unknown.
+    def quota_floor(self, nowtime, remaining):
+        if 0 <= remaining <= self.remaining:
+            self.cost = 0.8*self.cost + 0.2*(self.remaining - remaining)
+        self.remaining = remaining
+        if remaining < 0:
+            return 0
+        if remaining == 0:
+            return self.quota_secs(nowtime)
+        return self.quota_secs(nowtime) * self.cost / remaining
+
+    # games (dict)     - the Scraper's game buckets.
+    # lines (dict)     - prefix -> (start_time, line_info), see LineGenerator.
+    # remaining (int)  - odds api requests remaining, -1 if unknown.
+    #
+    # Returns (seconds, reason).
+    def next_wait(self, games, lines, remaining=-1):
+        nowtime = self.clock.now(pytz.timezone('US/Pacific'))
+        if games['live']:
+            phases = {game.id: PollScheduler.phase(game) for game in games['live'].values()}
+            phase = min(phases.values(), key=lambda phase: self.intervals[phase])
+            wait = self.intervals[phase]
+            reason = f'{phase} ({sum(p == phase for p in phases.values())}/{len(phases)} live games)'
+            floor = self.quota_floor(nowtime, remaining)
+            if floor > wait:
+                wait = floor
+                reason += f', quota floor with {remaining} requests remaining'
+            return wait, reason
+
+        # Note: Give a 30min buffer for games that start later than their listed start time.
+        starts = [start_time for start_time, _ in lines.values()
+                      if start_time > nowtime-PollScheduler.late_start_buffer]
+        if starts:
+            secs = (min(starts) - nowtime).total_seconds()
+            # If a game is starting later than its listed time then secs will be negative.
+            if secs > 0:
+                return secs, 'next game start'
+            return PollScheduler.late_start_wait, 'late game start'
+        if games['pregame']:
+            return PollScheduler.pregame_wait, 'pregame games with no listed lines'
+
+        # No games remain today.
+        wakeup = nowtime.replace(hour=PollScheduler.wakeup_hour, minute=0, second=0, microsecond=0)
+        if wakeup <= nowtime:
+            wakeup = pytz.timezone('US/Pacific').normalize(wakeup + datetime.timedelta(days=1))
+        return (wakeup - nowtime).total_seconds(), 'no games remaining today'
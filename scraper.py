@@ -1,12 +1,14 @@
 # External imports
 import datetime
 import pytz
-import time
 
 # Internal imports
-from soup import Soup, SoupParser
+from clock import Clock
+from extractor import GameStatus
+from soup import Soup
 from game import GameState
 from lines import LineGenerator
+from scheduler import PollScheduler
 
 class Scraper:
 
@@ -29,7 +31,13 @@ class Scraper:
     #        off the mlb.com website. And it helps resolve some double-header edge
     #        cases.
 
-    def __init__(self, dumper, generator, alerter, logger):
+    # webpage (Soup) - source of the game soups, a default Soup is opened if None.
+    # clock (Clock) - source of the current time and sleeps.
+    # scheduler (PollScheduler) - picks the wait between iterations.
+    # linefilter (LineFilter) - if set, only the markets that moved are dumped.
+    # history (HistoryStore) - if set, records the states of the games in memory.
+    def __init__(self, dumper, generator, alerter, logger, webpage=None, clock=None,
+                 scheduler=None, linefilter=None, history=None):
         # Dumps data out
         self.dumper = dumper
         # Generates game lines
@@ -38,6 +46,16 @@ class Scraper:
         self.alerter = alerter
         # Log
         self.logger = logger
+        # Scores page
+        self.webpage = webpage
+        # Time source
+        self.clock = clock if clock else Clock()
+        # Poll scheduler
+        self.scheduler = scheduler if scheduler else PollScheduler(self.clock)
+        # Last seen lines
+        self.linefilter = linefilter
+        # Game trajectories
+        self.history = history
         #
         # Game states
         # Games should transition from: pregame -> live -> final
@@ -49,8 +67,19 @@ class Scraper:
                         'live': {},
                         'final': {}
                      }
+        # Prefix index of the games dictionary.
+        # The ids for each prefix are ordered by start time, earliest first.
+        #
+        # Maps: bucket -> game id prefix -> [game ids]
+        self.index = {bucket: {} for bucket in self.games}
         # Set of ids for games that have been updated this iteration.
         self.updated = set()
+        # Maps: game soup fingerprint -> (bucket, game id) from the last iteration.
+        self.fingerprints = {}
+        # Number of final games archived out of memory.
+        self.archived = 0
+        # Writes queued by the current iteration, see write().
+        self.pending = []
 
     # This function logs and issues an alert.
     def notify(self, message):
@@ -64,8 +93,39 @@ class Scraper:
 
     # Looks up prefix in a given games dictionary
     # bucket in the set('pregame', 'live', 'final')
+    # Returns the matching ids, ordered by start time.
     def match(self, bucket, prefix):
-        return [id for id in self.games[bucket].keys() if id[:-1] == prefix]
+        return self.index[bucket].get(prefix, [])
+
+    # Index ordering, games without a start time go last.
+    def start_key(self, bucket):
+        return lambda id: (self.games[bucket][id].start_time is None,
+                           self.games[bucket][id].start_time)
+
+    # Adds a game to the games dictionary and the prefix index.
+    def add(self, bucket, game):
+        self.games[bucket][game.id] = game
+        if self.history and game.history is None:
+            game.history = self.history.track(game.id)
+        ids = self.index[bucket].setdefault(game.id[:-1], [])
+        ids.append(game.id)
+        ids.sort(key=self.start_key(bucket))
+        return game
+
+    # Removes a game from the games dictionary and the prefix index.
+    def remove(self, bucket, id):
+        game = self.games[bucket].pop(id)
+        ids = self.index[bucket][id[:-1]]
+        ids.remove(id)
+        if not ids:
+            del self.index[bucket][id[:-1]]
+        return game
+
+    # Sets a pregame's start time, keeping the index ordered.
+    def set_start_time(self, game, start_time):
+        game.start_time = start_time
+        if game.id in self.games['pregame']:
+            self.index['pregame'][game.id[:-1]].sort(key=self.start_key('pregame'))
 
     # Lookup live games that match the prefix.
     def lookup_live(self, prefix):
@@ -81,13 +141,11 @@ class Scraper:
         if pregame_matches:
             # If we have multiple matches then take the game with the earliest
             # start time.
-            return sorted([self.games['pregame'][id] for id in pregame_matches],
-                           key=lambda game: game.start_time)[0]
+            return self.games['pregame'][pregame_matches[0]]
         # Else, we need to create a new game
         id = GameState.new_game_id(prefix)
         self.notify(f'CREATING NEW LIVE GAME {id}')
-        self.games['live'][id] = GameState(id)
-        return self.games['live'][id]
+        return self.add('live', GameState(id))
 
     # Lookup games in the pregame hash.
     #
@@ -125,8 +183,7 @@ class Scraper:
         # Else, if we have no prefix + start time matches, then make a new game.
         id = GameState.new_game_id(prefix)
         self.notify(f'CREATING NEW PREGAME {id}')
-        self.games['pregame'][id] = GameState(id)
-        return self.games['pregame'][id]
+        return self.add('pregame', GameState(id))
 
     # Lookup games in the final hash.
     def lookup_final(self, prefix):
@@ -151,13 +208,11 @@ class Scraper:
         # start time in a final game soup, so we take the game with the
         # earliest start time.
         if pre_matches:
-            return sorted([self.games['pregame'][id] for id in pre_matches],
-                        key=lambda g: g.start_time)[0]
+            return self.games['pregame'][pre_matches[0]]
         # Else, we create a new game.
         id = GameState.new_game_id(prefix)
         self.notify(f'CREATING NEW FINAL GAME {id}')
-        self.games['final'][id] = GameState(id)
-        return self.games['final'][id]
+        return self.add('final', GameState(id))
 
     # Move the game with id from 'from' to 'to'.
     allowed_txn = set((('pregame', 'live'),
@@ -170,137 +225,265 @@ class Scraper:
         assert((orig, dest) in Scraper.allowed_txn)
         # Check that a game with the same id isn't in our destination state.
         assert(not id in self.games[dest].keys())
-        # Move the game
-        self.games[dest][id] = self.games[orig][id]
-        del self.games[orig][id]
-
-    # Returns the time until the next game starts in seconds.
-    # With a 30 min buffer for late start games, in which case 30 secs is returned.
-    def time_until_next_game(self, lines):
-        # Get the current time, in eastern timezone.
-        nowtime = datetime.datetime.now().astimezone(pytz.timezone('US/Pacific'))
-        # Get the next game start time, in pacific timezone, filtered s.t. we exclude games
-        # that have already started.
-        # Note: Give a 30min buffer for games that start later than their listed start time.
-        gametime = min([start_time for start_time, _ in lines.values() if 
-                            start_time > nowtime-datetime.timedelta(minutes=30)])
-        # Calculate the difference in seconds.
-        secs = (gametime - nowtime).total_seconds()
-        # If a game is starting later than its listed time then secs will be negative.
-        # Instead, we want to wait thirty seconds.
-        return secs if secs > 0 else 30
+        # Move the game, and its index entry
+        game = self.add(dest, self.remove(orig, id))
+        # Final games aren't dumped again, drop their last line snapshot.
+        if dest == 'final':
+            game.line_info = None
 
-    def scrape(self):
+    # Processes a single game record.
+    # Returns the GameState the record was applied to, or None if it was skipped.
+    def process(self, record, timestamp, lines):
+        # Get the game id prefix for the game soup
+        prefix = GameState.get_id_prefix(record.teams[1],
+                                         self.clock.now(pytz.timezone('US/Pacific')))
+        #
+        # Parse warmup games
+        if record.status is GameStatus.WARMUP:
+            return None # Skip warmup games
+        #
+        # Parse live game update
+        elif record.status is GameStatus.LIVE:
+            # Find the GameState for the corresponding prefix
+            game = self.lookup_live(prefix)
+            # Transition the game from pregame to live, if needed.
+            if game.id in self.games['pregame'].keys():
+                self.notify(f'TRANSITIONING {game.id} from pregame to live')
+                self.transition(game.id, 'pregame', 'live')
+            # Update game state
+            game.update(timestamp,
+                        record,
+                        lines.get(prefix, (None, None))[1])
+            # Add to updated set.
+            self.updated.add(game.id)
+            # Dump game state and line info
+            self.pending.append(('state', game, None))
+            self.queue_lines(game)
+            # Log
+            self.logger.log('---------------------------------------------------')
+            self.logger.log(str(game))
+            self.logger.log()
+        #
+        # Parse pre game info
+        elif record.status is GameStatus.PREGAME:
+            # Find the GameState for the corresponding prefix.
+            # Account for a change in start time for delayed games.
+            start_time = record.start_time
+            game = self.lookup_pregames(prefix, start_time, record.is_delayed)
+            # Set start time if its not already set.
+            if not game.start_time:
+                self.set_start_time(game, start_time)
+            # Add to updated set.
+            self.updated.add(game.id)
+        #
+        # Parse post game or postponed game info.
+        elif record.status in (GameStatus.FINAL,
+                               GameStatus.POSTPONED,
+                               GameStatus.SUSPENDED):
+            # Find the GameState for the corresponding prefix
+            game = self.lookup_final(prefix)
+            # Notify if a live game is postponed or suspended.
+            if game.id in self.games['live'].keys() and record.is_postponed:
+                self.notify(f'POSTPONED {game.id}')
+            if game.id in self.games['live'].keys() and record.is_suspended:
+                self.notify(f'SUSPENDED {game.id}')
+            # Move the game to the final hash, if needed.
+            if game.id in self.games['pregame'].keys():
+                self.notify(f'TRANSITIONING {game.id} from pregame to final')
+                self.transition(game.id, 'pregame', 'final')
+            elif game.id in self.games['live'].keys():
+                self.notify(f'TRANSITIONING {game.id} from live to final')
+                self.transition(game.id, 'live', 'final')
+            # Add to updated set
+            self.updated.add(game.id)
+        else:
+            self.notify('WARNING: Couldnt identify the game soup.')
+            return None
+        return game
+
+    # Returns the (bucket, id) of the game, for the fingerprint cache.
+    def bucket_of(self, game):
+        for bucket, games in self.games.items():
+            if game.id in games:
+                return bucket, game.id
+        return None, game.id
+
+    # Applies an iteration to a game whose soup hasn't changed since it was
+    # last processed. The game's state is unchanged, so only its timestamp and
+    # lines are refreshed, and no state row is dumped.
+    #
+    # Returns False if the game has since moved buckets, in which case the soup
+    # must be processed in full.
+    def reuse(self, entry, timestamp, lines):
+        bucket, id = entry
+        # Warmup game, nothing to do.
+        if id is None:
+            return True
+        if not id in self.games[bucket] or id in self.updated:
+            return False
+        game = self.games[bucket][id]
+        if bucket == 'live':
+            game.refresh(timestamp, lines.get(id[:-1], (None, None))[1])
+            self.queue_lines(game)
+        self.updated.add(id)
+        return True
+
+    # Queues the game's lines to be dumped, if it has any.
+    # With a line filter only the markets that moved are dumped, and nothing
+    # if none did.
+    def queue_lines(self, game):
+        if game.line_info is None:
+            return
+        lines = self.linefilter.changed(game.id, game.line_info) if self.linefilter else game.line_info
+        if len(lines):
+            self.pending.append(('lines', game, lines))
+
+    # Archives final games from previous days out of memory, once their writes
+    # are flushed, and prunes the prefix counters for previous days.
+    # This keeps memory flat over a season-long run.
+    def retain(self):
+        today = self.clock.now(pytz.timezone('US/Pacific')).strftime('%Y%m%d')
+        # Game ids end with 'YYYYMMDD' + suffix
+        stale = [id for id in self.games['final'] if id[-9:-1] < today]
+        if stale:
+            self.dumper.flush()
+            for id in stale:
+                game = self.remove('final', id)
+                if self.linefilter:
+                    self.linefilter.forget(id)
+                if self.history:
+                    self.history.forget(id)
+                self.logger.log(f'ARCHIVED {id} teams={game.teams} score={game.score}')
+            self.archived += len(stale)
+        held = set()
+        for bucket in self.index.values():
+            held.update(bucket.keys())
+        GameState.prune_prefixes(today, held)
+
+    # Logs live object counts and approximate retained bytes.
+    def log_memory(self):
+        games = [game for bucket in self.games.values() for game in bucket.values()]
+        self.logger.log(f"Memory: pregame={len(self.games['pregame'])}"
+                        f" live={len(self.games['live'])}"
+                        f" final={len(self.games['final'])}"
+                        f" archived={self.archived}"
+                        f" prefix_ids={len(GameState.prefix_ids)}"
+                        f" fingerprints={len(self.fingerprints)}"
+                        f" retained={sum(game.retained_bytes() for game in games)}B")
+
+    # Runs the processing step of an iteration on the brewed game records.
+    # Game states are updated and transitioned here, in page order.
+    #
+    # Returns the writes for the iteration, see write().
+    def iterate(self, timestamp, lines, records):
         tz = pytz.timezone('US/Pacific')
-        webpage = Soup()
+
+        # Initialize updated set to empty at the start of an iteration.
+        self.updated = set()
+
+        # Each game has its own soup that we must process.
+        # Game soups that are unchanged since the last iteration skip parsing.
+        fingerprints = {}
+        hits, misses = 0, 0
+        for record in records:
+            entry = self.fingerprints.get(record.fingerprint)
+            if entry and self.reuse(entry, timestamp, lines):
+                hits += 1
+            else:
+                misses += 1
+                game = self.process(record, timestamp, lines)
+                # Unidentified soups are processed again next iteration.
+                if game is None and record.status is not GameStatus.WARMUP:
+                    continue
+                entry = self.bucket_of(game) if game else (None, None)
+            fingerprints[record.fingerprint] = entry
+        self.fingerprints = fingerprints
+        self.logger.log(f'Fingerprint hits: {hits} misses: {misses}')
+
+        # Print line API usage statistics
+        stats = self.linegen.usage()
+        self.logger.log('Remaining: ' + str(stats[0]) + ' Used: ' + str(stats[1])
+                        + ' Lines: ' + str(self.linegen.metrics()))
+        if self.linefilter:
+            self.logger.log('Line filter: ' + str(self.linefilter.metrics()))
+        if self.history:
+            self.logger.log('History: ' + str(self.history.metrics()))
+
+        # Check for stale live games.
+        cpy_live_games = list(self.games['live'].values())
+        for game in cpy_live_games:
+            # If a game in the live bucket hasn't been updated in a hour, then issue an alert.
+            if (self.clock.now(tz) - game.timestamp.replace(tzinfo=tz)).total_seconds() > 3600:
+                self.notify(f"WARNING: {game.id} hasnt been updated in over an hour")
+            # If a game in the live bucket hasn't been updated in 5 hours, then drop it to the final bucket.
+            if (self.clock.now(tz) - game.timestamp.replace(tzinfo=tz)).total_seconds() > 5*3600:
+                self.notify(f"WARNING: {game.id} hasn't been updated in 5 hours.\nTransitioning from live to final.")
+                self.transition(game.id, 'live', 'final')
+
+        # Archive finished games from previous days.
+        self.retain()
+        self.log_memory()
+
+        writes, self.pending = self.pending, []
+        return writes
+
+    # Dumps the writes of an iteration, in order, then commits them.
+    # writes - list of ('state' | 'lines', GameState, LineSnapshot of the
+    #          lines to dump, None for states)
+    def write(self, writes):
+        for kind, game, lines in writes:
+            if kind == 'state':
+                self.dumper.dump_state(game)
+            else:
+                self.dumper.dump_lines(game, lines)
+        self.dumper.commit()
+
+    # Returns the id prefixes of the live games, whose odds are queried.
+    def live_prefixes(self):
+        return {id[:-1] for id in self.games['live']}
+
+    # Returns the number of seconds to wait before the next iteration.
+    # See PollScheduler.
+    def wait_time(self, lines):
+        tz = pytz.timezone('US/Pacific')
+        wait_time, reason = self.scheduler.next_wait(self.games, lines, self.linegen.usage()[0])
+        self.logger.log(f'Schedule: {wait_time:.0f}s {reason}')
+        # If we don't have a current game going, then notify the wakeup time.
+        if not self.games['live']:
+            wakeup_time = self.clock.now(tz) + datetime.timedelta(seconds=wait_time)
+            self.notify(f"""No live games, sleeping {wait_time} seconds.\nWakeup time at {wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}""")
+        return wait_time
+
+    # Runs one scrape iteration on the webpage.
+    # Returns the lines of the iteration.
+    def step(self, webpage):
+        tz = pytz.timezone('US/Pacific')
+        self.logger.log(f"---> {self.clock.now(tz).strftime('%m/%d/%Y')} {self.clock.now(tz).strftime('%H:%M:%S')}")
+
+        # Time the soup was brewed and lines were generated.
+        timestamp = self.clock.now(tz)
+        # Get current lines.
+        lines = self.linegen.get_lines(self.live_prefixes())
+
+        # Process the game soups, then dump the game states and lines.
+        self.write(self.iterate(timestamp, lines, webpage.brew(parsed=True)))
+
+        # Print browser session statistics
+        self.logger.log('Browser: ' + str(webpage.metrics()))
+        # Print write pipeline statistics
+        self.logger.log('Dumper: ' + str(self.dumper.metrics()))
+        return lines
+
+    def scrape(self):
+        webpage = self.webpage if self.webpage else Soup()
         while True:
-            self.logger.log(f"---> {datetime.datetime.now(tz).strftime('%m/%d/%Y')} {datetime.datetime.now(tz).strftime('%H:%M:%S')}")
-
-            # Time the soup was brewed and lines were generated.
-            timestamp = datetime.datetime.now(tz)
-            # Get current lines.
-            lines = self.linegen.get_lines()
-
-            # Initialize updated set to empty at the start of an iteration.
-            self.updated = set()
-
-            # Each game has its own soup that we must process.
-            for soup in webpage.brew():
-                # Get the game id prefix for the game soup
-                teams = SoupParser.get_teams(soup)
-                prefix = GameState.get_id_prefix(teams[1])
-                #
-                # Parse warmup games
-                if SoupParser.is_warmup(soup):
-                    continue # Skip warmup games
-                #
-                # Parse live game update
-                elif SoupParser.is_live(soup):
-                    # Find the GameState for the corresponding prefix
-                    game = self.lookup_live(prefix)
-                    # Transition the game from pregame to live, if needed.
-                    if game.id in self.games['pregame'].keys():
-                        self.notify(f'TRANSITIONING {game.id} from pregame to live')
-                        self.transition(game.id, 'pregame', 'live')
-                    # Update game state
-                    game.update(timestamp,
-                                SoupParser.parse_live(soup),
-                                lines.get(prefix, (None, None))[1])
-                    # Add to updated set.
-                    self.updated.add(game.id)
-                    # Dump game state and line info
-                    self.dumper.dump_state(game)
-                    if not game.line_info is None:
-                        self.dumper.dump_lines(game)
-                    # Log
-                    self.logger.log('---------------------------------------------------')
-                    self.logger.log(str(game))
-                    self.logger.log()
-                #
-                # Parse pre game info
-                elif SoupParser.is_pregame(soup):
-                    # Find the GameState for the corresponding prefix.
-                    # Account for a change in start time for delayed games.
-                    start_time = SoupParser.get_start_time(soup)
-                    game = self.lookup_pregames(prefix, start_time, SoupParser.is_delayed(soup))
-                    # Set start time if its not already set.
-                    if not game.start_time:
-                        game.start_time = start_time
-                    # Add to updated set.
-                    self.updated.add(game.id)
-                #
-                # Parse post game or postponed game info.
-                elif (SoupParser.is_final(soup) or
-                      SoupParser.is_postponed(soup) or
-                      SoupParser.is_suspended(soup)):
-                    # Find the GameState for the corresponding prefix
-                    game = self.lookup_final(prefix)
-                    # Notify if a live game is postponed or suspended.
-                    if game.id in self.games['live'].keys() and SoupParser.is_postponed(soup):
-                        self.notify(f'POSTPONED {game.id}')
-                    if game.id in self.games['live'].keys() and SoupParser.is_suspended(soup):
-                        self.notify(f'SUSPENDED {game.id}')
-                    # Move the game to the final hash, if needed.
-                    if game.id in self.games['pregame'].keys():
-                        self.notify(f'TRANSITIONING {game.id} from pregame to final')
-                        self.transition(game.id, 'pregame', 'final')
-                    elif game.id in self.games['live'].keys():
-                        self.notify(f'TRANSITIONING {game.id} from live to final')
-                        self.transition(game.id, 'live', 'final')
-                    # Add to updated set
-                    self.updated.add(game.id)
-                else:
-                    self.notify('WARNING: Couldnt identify the game soup.')
-
-            # Print line API usage statistics
-            stats = self.linegen.usage()
-            self.logger.log('Remaining: ' + str(stats[0]) + ' Used: ' + str(stats[1]))
-
-            # Check for stale live games.
-            cpy_live_games = self.games['live'].values()
-            for game in cpy_live_games:
-                # If a game in the live bucket hasn't been updated in a hour, then issue an alert.
-                if (datetime.datetime.now(tz) - game.timestamp.replace(tzinfo=tz)).total_seconds() > 3600:
-                    self.notify(f"WARNING: {game.id} hasnt been updated in over an hour")
-                # If a game in the live bucket hasn't been updated in 5 hours, then drop it to the final bucket.
-                if (datetime.datetime.now(tz) - game.timestamp.replace(tzinfo=tz)).total_seconds() > 5*3600:
-                    self.notify(f"WARNING: {game.id} hasn't been updated in 5 hours.\nTransitioning from live to final.")
-                    self.transition(game.id, 'live', 'final')
+            lines = self.step(webpage)
 
             # Determine wait time.
-            # If we don't have a current game going, then wait for the next to start (or wait two hours).
-            if not self.games['live']:
-                wait_time = self.time_until_next_game(lines)
-                wakeup_time = datetime.datetime.now(tz) + datetime.timedelta(seconds=wait_time)
-                self.notify(f"""No live games, sleeping {wait_time} seconds.\nWakeup time at {wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}""")
-            # Else, pause for a minute, then continue scraping.
-            else:
-                wait_time = 60
-            # Close the webpage while we sleep
-            if wait_time > 60:
-                webpage.close()
+            wait_time = self.wait_time(lines)
             # Sleep
-            time.sleep(wait_time)
-            # Reopen the webpage
-            if wait_time > 60:
-                webpage.open()
+            self.clock.sleep(wait_time)
+            # Reload the webpage after a long sleep.
+            # The browser session is only replaced if it's past its thresholds.
+            if wait_time > PollScheduler.reload_after:
+                webpage.reload()
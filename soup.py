@@ -4,63 +4,183 @@ import pytz
 #from urllib.request import Request, urlopen
 import re
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 import time
 #from webdriver_manager.chrome import ChromeDriverManager
 
+# Internal imports
+from browser import BrowserManager
+from extractor import ParsedGame
+
 class Soup:
 
     url = 'https://www.mlb.com/scores'
 
     max_attempts = 5 # Number of brew attempts before throwing an error.
 
-    def __init__(self):
-        # Raspberry Pi driver substitution
-        #service = ChromeService(executable_path='/usr/bin/chromedriver') 
-        #self.driver = webdriver.Chrome(service=service,
-        #                               options=options)
+    # Game container selector, used by the push mode scripts.
+    game_selector = '[data-test-mlb="singleGameContainer"]'
+
+    # Push mode script, injected into the page.
+    # Tags each game container with an index and watches the scores root for
+    # mutations, recording the index of every container that changed or was
+    # removed since the last collection.
+    # Returns false if the scores root isn't on the page yet.
+    watch_js = """
+        const root = document.querySelector('#scores-schedule-root');
+        if (!root) {
+            return false;
+        }
+        const sel = '""" + game_selector + """';
+        const state = {root: root, next: 0, changed: new Set(), removed: new Set()};
+        const tag = (game) => {
+            if (!game.dataset.scraperIdx) {
+                game.dataset.scraperIdx = String(state.next++);
+            }
+            state.changed.add(game.dataset.scraperIdx);
+        };
+        const games = (node) => node.nodeType !== 1 ? [] :
+            (node.matches(sel) ? [node] : Array.from(node.querySelectorAll(sel)));
+        root.querySelectorAll(sel).forEach(tag);
+        if (window.__scraper) {
+            window.__scraper.observer.disconnect();
+        }
+        state.observer = new MutationObserver((mutations) => {
+            for (const m of mutations) {
+                const target = m.target.nodeType === 1 ? m.target : m.target.parentElement;
+                const game = target && target.closest(sel);
+                if (game) {
+                    tag(game);
+                    continue;
+                }
+                m.addedNodes.forEach((node) => games(node).forEach(tag));
+                m.removedNodes.forEach((node) => games(node).forEach((g) => {
+                    if (g.dataset.scraperIdx) {
+                        state.removed.add(g.dataset.scraperIdx);
+                    }
+                }));
+            }
+        });
+        state.observer.observe(root, {subtree: true, childList: true,
+                                      attributes: true, characterData: true});
+        window.__scraper = state;
+        return true;
+    """
+
+    # Push mode script, called every brew.
+    # Returns [[index, outerHTML], ...] of the changed containers, the list of
+    # removed indices and the indices of the containers in page order, or null
+    # if the watch script is no longer on the page.
+    collect_js = """
+        const state = window.__scraper;
+        if (!state || !document.contains(state.root)) {
+            return null;
+        }
+        const sel = '""" + game_selector + """';
+        const changed = [];
+        state.changed.forEach((idx) => {
+            const game = state.root.querySelector('[data-scraper-idx="' + idx + '"]');
+            if (game) {
+                changed.push([Number(idx), game.outerHTML]);
+            }
+        });
+        const removed = Array.from(state.removed, Number);
+        const order = Array.from(state.root.querySelectorAll(sel),
+                                 (game) => Number(game.dataset.scraperIdx));
+        state.changed.clear();
+        state.removed.clear();
+        return [changed, removed, order];
+    """
+
+    # features (str) - BeautifulSoup tree builder used to parse the page,
+    #                  e.g. 'html.parser' or 'lxml' (requires lxml installed).
+    # push (bool) - if set, a MutationObserver is injected into the page and
+    #               brew() only pulls the game containers that changed since the
+    #               last brew, instead of the whole page source.
+    # browser (BrowserManager) - provides the browser sessions.
+    # recorder (Recorder) - if set, every brew's game soups are recorded for replay.
+    def __init__(self, features='html.parser', push=False, browser=None, recorder=None):
+        self.features = features
+        self.push = push
+        self.browser = browser if browser else BrowserManager()
+        self.recorder = recorder
+        # Push mode records, container index -> ParsedGame
+        self.records = {}
+        # Raspberry Pi driver substitution:
+        #   BrowserManager(driver_path='/usr/bin/chromedriver')
         self.open()
 
-    def brew(self):
+    # Returns the game soups on the scores page.
+    # If parsed is set, each game soup is wrapped in a ParsedGame record.
+    # The browser session is recycled first if it's past its age or memory
+    # threshold, so it's checked every iteration during a live slate.
+    def brew(self, parsed=False):
+        if self.browser.recycle():
+            self.open()
         attempts = 0
         while attempts < Soup.max_attempts:
             try:
-                soup = bs.BeautifulSoup(self.driver.page_source, 'html.parser')
+                records = self.pull_changes() if self.push else self.pull()
                 break
             except Exception as e:
+                self.browser.fail()
                 self.open()
                 attempts += 1
                 print(e)
         if attempts >= Soup.max_attempts:
             assert(False)
-        return soup.find('main'
-                        ).find('div', {'id': 'scores-schedule-root'}
-                        ).find_all('div', {'data-test-mlb': 'singleGameContainer'})
+        if self.recorder:
+            self.recorder.record('brew', [str(record.soup) for record in records])
+        return records if parsed else [record.soup for record in records]
+
+    # Parses the whole page source.
+    def pull(self):
+        soup = bs.BeautifulSoup(self.driver.page_source, self.features)
+        games = soup.find('main'
+                         ).find('div', {'id': 'scores-schedule-root'}
+                         ).find_all('div', {'data-test-mlb': 'singleGameContainer'})
+        return [ParsedGame(game) for game in games]
+
+    # Parses only the containers that changed since the last pull.
+    # Unchanged containers keep their ParsedGame record from an earlier pull.
+    def pull_changes(self):
+        changes = self.driver.execute_script(Soup.collect_js)
+        # The observer is lost if the page reloaded, so watch it again.
+        if changes is None:
+            if not self.watch():
+                return self.pull()
+            changes = self.driver.execute_script(Soup.collect_js)
+        changed, removed, order = changes
+        for idx in removed:
+            self.records.pop(idx, None)
+        for idx, html in changed:
+            self.records[idx] = ParsedGame(bs.BeautifulSoup(html, self.features).div)
+        # A container the page re-renders gets a new index but keeps its place,
+        # so the records follow the page order rather than the indices.
+        return [self.records[idx] for idx in order if idx in self.records]
+
+    # Injects the push mode observer.
+    # Returns False if the scores root isn't on the page yet.
+    def watch(self):
+        self.records = {}
+        return bool(self.driver.execute_script(Soup.watch_js))
 
     def open(self):
-        options = webdriver.ChromeOptions()
-        options.add_argument('log-level=3')
-        options.add_argument('--headless')
-        options.add_argument('--disable-dev-shm-usage') # Only for Ubuntu (?)
-        options.add_argument('--no-sandbox')            # Only for Ubuntu (?)
-#        options.add_argument('--disable-gpu')
-#        options.add_argument('--disable-software-rasterizer')
-#        options.add_argument('enable-automation')
-#        options.add_argument('--disable-infobars')
-        self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()),
-                                       options=options)
-#       self.driver = webdriver.Chrome(options=options)
-#        self.driver = webdriver.Remote(
-#            desired_capabilities=webdriver.DesiredCapabilities.CHROME.copy(),
-#            command_executor='http://13.52.211.102:4444/wd/hub'
-#        )
-        self.driver.implicitly_wait(5)
+        self.driver = self.browser.acquire()
         self.driver.get(Soup.url)
+        if self.push:
+            self.watch()
+
+    # Reloads the scores page, recycling the browser session first if it's
+    # past its age or memory threshold.
+    def reload(self):
+        self.browser.recycle()
+        self.open()
+
+    def metrics(self):
+        return self.browser.metrics()
 
     def close(self):
-        self.driver.quit()
+        self.browser.close()
         self.driver = None
 
 
@@ -182,19 +302,19 @@ class SoupParser:
     # Is the game for the soup live?
     # If the inning result has a valid prefix then the game is live.
     # This is meant to exclude the 'Warmup' status
+    valid_innings = set(('Top', 'Bot', 'Mid', 'End'))
     def is_live(soup):
-        valid_innings = set(('Top', 'Bot', 'Mid', 'End'))
         inning = SoupParser.get_inning(soup)
-        return inning[:3] in valid_innings and not SoupParser.is_suspended(soup)
+        return inning[:3] in SoupParser.valid_innings and not SoupParser.is_suspended(soup)
 
     # Is the game for the soup final?
+    final_ptrn = re.compile(r'Final')
     def is_final(soup):
-        final_ptrn = re.compile(r'Final')
-        return bool(final_ptrn.match(SoupParser.get_final(soup)))
+        return bool(SoupParser.final_ptrn.match(SoupParser.get_final(soup)))
     
+    postponed_ptrn = re.compile(r'Postponed')
     def is_postponed(soup):
-        postponed_ptrn = re.compile(r'Postponed')
-        return bool(postponed_ptrn.match(SoupParser.get_final(soup)))
+        return bool(SoupParser.postponed_ptrn.match(SoupParser.get_final(soup)))
 
     # Set of pregame parsing functions
     pre_funcs = {
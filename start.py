@@ -1,24 +1,48 @@
 # External imports
+import time
+startup = time.perf_counter()
 import argparse
+import asyncio
+import datetime
+import json
+import pytz
+import sys
 import yaml
 
 # Internal imports
+# Sinks, sources and modes that aren't configured aren't imported, so their
+# dependencies (pandas, mysql.connector, webdriver_manager) only load if used.
 from alert import Alert
+from browser import BrowserManager
 from scraper import Scraper
-from mysqldb import Database
+from history import HistoryStore
+from oddsclient import OddsClient
+from linefilter import LineFilter
 from lines import LineGenerator
-from csvdumper import CSVDumper
 from logger import Logger
+from soup import Soup
+from teams import TeamRegistry
 
 # Parse the command line args
 parser = argparse.ArgumentParser()
 parser.add_argument('config')
+# Time each startup stage through the first scrape iteration, then exit.
+parser.add_argument('--profile-startup', action='store_true')
 
 args = parser.parse_args()
 
+# Startup stage -> seconds since the previous stage
+stages = {'imports': time.perf_counter() - startup}
+def stage(name):
+    stages[name] = time.perf_counter() - startup - sum(stages.values())
+
 # Open the configuration file
 with open(args.config, 'r') as yamlfile:
     config = yaml.load(yamlfile, Loader=yaml.FullLoader)
+stage('config')
+
+# Extra team name spellings, alias -> Retrosheet team id
+TeamRegistry.aliases.update(config.get('team-aliases', {}))
 
 # Initialize the alert system.
 alerter = Alert(config["sender"],
@@ -29,32 +53,126 @@ alerter = Alert(config["sender"],
 logger = Logger(config["log-path"])
 
 # Connect to the MySQL DB, if enabled
-dumper = Database(config["db-host"],
-                  config["db-user"],
-		  config["db-password"],
-                  config["db-name"],
-                  config["db-port"] if "db-port" in config else 3306) if config.get("db-enabled") else None
-
+if config.get("db-enabled"):
+    from mysqldb import Database
+    dumper = Database(config["db-host"],
+                      config["db-user"],
+                      config["db-password"],
+                      config["db-name"],
+                      config["db-port"] if "db-port" in config else 3306,
+                      pool_size=config.get('db-pool-size', 2))
 # Else, use the CSV Dumper
 # Check for CSV paths if MySQL is not enabled
-if not dumper:
+else:
+    from csvdumper import CSVDumper
     assert('game-outpath' in config and 'line-outpath' in config)
-    dumper = CSVDumper(config['game-outpath'], config['line-outpath'])
+    dumper = CSVDumper(config['game-outpath'], config['line-outpath'],
+                       max_open=config.get('csv-max-open', 32),
+                       fsync_secs=config.get('csv-fsync-secs', 30))
+
+# Only dump the lines markets that moved, warmed from today's rows in the DB
+linefilter = LineFilter() if config.get('lines-filter', True) else None
+if linefilter and config.get("db-enabled"):
+    today = datetime.datetime.now(pytz.timezone('US/Pacific')).replace(hour=0, minute=0, second=0)
+    logger.log(f'Line filter warmed with {linefilter.warm(dumper.last_lines(today))} markets')
+
+# Keep the recent states of each game in memory, history-rows per game
+history = HistoryStore(config.get('history-rows', 512)) if config.get('history', True) else None
+
+# Write rows from background threads, if enabled
+if config.get('write-pipeline'):
+    from pipeline import WritePipeline
+    dumper = WritePipeline(dumper,
+                           writers=config.get('write-writers', 1),
+                           maxsize=config.get('write-queue-size', 1000),
+                           backpressure=config.get('write-backpressure', 'block'),
+                           spill_path=config.get('write-spill-path'),
+                           on_lost=linefilter.revert if linefilter else None)
+
+stage('dumper')
+
+# Record brews and api responses for replay, if enabled
+recorder = None
+if config.get('record-path'):
+    from replay import Recorder
+    recorder = Recorder(config['record-path'])
 
 # Build line generator
-line_generator = LineGenerator(config["api-key"])
+# Lines are reused for up to lines-ttl secs while games are live or about to
+# start, stretched to fit the api quota, and for lines-idle-ttl secs otherwise.
+line_generator = LineGenerator(config["api-key"], recorder=recorder,
+                               ttl=config.get('lines-ttl', 60),
+                               idle_ttl=config.get('lines-idle-ttl', 30*60),
+                               scoped=config.get('lines-scoped', False),
+                               stream=config.get('lines-stream', True),
+                               client=OddsClient(config["api-key"],
+                                                 timeout=(config.get('odds-connect-timeout', 5),
+                                                          config.get('odds-read-timeout', 20))),
+                               params=dict(LineGenerator.default_params,
+                                           BOOKMAKERS=config.get('lines-bookmakers')))
+stage('lines')
+
+# Build the browser session manager
+browser = BrowserManager(config.get('driver-path'),
+                         standby=config.get('browser-standby', True),
+                         max_age=config.get('browser-max-age', 6*3600),
+                         max_rss=config.get('browser-max-rss-mb', 1024)*1024*1024,
+                         profile=config.get('browser-profile', 'default'))
+
+# Open the scores page
+webpage = Soup(push=config.get('push-mode', False),
+               browser=browser,
+               recorder=recorder)
+stage('browser')
 
 # Start scrapper object, initializes games dictionary.
-bot = Scraper(dumper, line_generator, alerter, logger)
+# The async scrapper overlaps the odds query, the page snapshot and the dumps.
+if config.get('async-mode'):
+    from aioscraper import AsyncScraper
+    scraper = AsyncScraper
+else:
+    scraper = Scraper
+bot = scraper(dumper, line_generator, alerter, logger, webpage=webpage,
+              linefilter=linefilter, history=history)
 
 # Check for CSV paths if MySQL is not enabled
 if not config.get("db-enabled"):
     assert('game-outpath' in config and 'line-outpath' in config)
+stage('scraper')
+
+# Run a single iteration and print the startup stages.
+if args.profile_startup:
+    try:
+        bot.step(webpage)
+        stage('first scrape')
+    finally:
+        dumper.close()
+        webpage.close()
+        if recorder:
+            recorder.close()
+    heavy = ('pandas', 'selenium', 'webdriver_manager', 'mysql.connector', 'bs4', 'requests')
+    print(json.dumps({
+        'stages_secs': stages,
+        'total_secs': time.perf_counter() - startup,
+        # Overhead of python itself, excluding the browser and the network.
+        'python_secs': stages['imports'] + stages['config'] + stages['scraper'],
+        'heavy_modules': [module for module in heavy if module in sys.modules]
+    }, indent=2))
+    sys.exit(0)
 
 # Run
-while True:
-#    try:
-    bot.scrape()
-#    except Exception as e:
-#        bot.notify("WARNING: Exception incountered, restarting scrape process.\n"+str(e))
-#        sleep(5*60)
+# Queued rows are written out on shutdown.
+try:
+    while True:
+#        try:
+        if config.get('async-mode'):
+            asyncio.run(bot.run())
+        else:
+            bot.scrape()
+#        except Exception as e:
+#            bot.notify("WARNING: Exception incountered, restarting scrape process.\n"+str(e))
+#            sleep(5*60)
+finally:
+    dumper.close()
+    if recorder:
+        recorder.close()
@@ -0,0 +1,85 @@
+# External imports
+import csv
+import datetime
+import os
+import re
+
+# Team name to Retrosheet team id lookups, built once per season from the
+# data/TEAMyyyy files (id, league, city, nickname).
+#
+# Names are matched case-insensitively on:
+#   - the nickname,                  e.g. 'Yankees', 'D-backs' (mlb.com)
+#   - the city and nickname,         e.g. 'Arizona Diamondbacks' (odds api)
+#   - aliases,                       e.g. 'Los Angeles Angels'
+# Other names are resolved by their longest known suffix, e.g.
+# 'Los Angeles Dodgers' -> 'Dodgers', and cached.
+class TeamRegistry:
+    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    # Alias -> team id, added to every season.
+    aliases = {
+        "A's": 'OAK',
+        'Los Angeles Angels': 'ANA',
+        'LA Angels': 'ANA',
+        'LA Dodgers': 'LAN',
+        'Dbacks': 'ARI'
+    }
+
+    # Maps: season (int) -> TeamRegistry
+    seasons = {}
+
+    # season (int)    - season the registry was loaded for.
+    # rows (list)     - (id, league, city, nickname) rows.
+    # aliases (dict)  - alias -> team id, on top of the class aliases.
+    def __init__(self, season, rows, aliases=None):
+        self.season = season
+        self.leagues = {}
+        # Maps: casefolded name -> team id
+        self.names = {}
+        for id, league, city, nickname in rows:
+            self.leagues[id] = league
+            self.names[nickname.casefold()] = id
+            self.names[f'{city} {nickname}'.casefold()] = id
+        for alias, id in dict(TeamRegistry.aliases, **(aliases if aliases else {})).items():
+            self.names[alias.casefold()] = id
+
+    # Returns the registry of the season, loading it on first use.
+    # Seasons without a team file use the latest earlier one.
+    def for_season(season=None):
+        season = season if season else datetime.datetime.now().year
+        if not season in TeamRegistry.seasons:
+            TeamRegistry.seasons[season] = TeamRegistry.load(season)
+        return TeamRegistry.seasons[season]
+
+    # Returns the seasons with a team file, in order.
+    def available(path=None):
+        path = path if path else TeamRegistry.data_path
+        return sorted(int(match.group(1)) for match in
+                      (re.fullmatch(r'TEAM(\d{4})', file) for file in os.listdir(path)) if match)
+
+    def load(season, path=None):
+        path = path if path else TeamRegistry.data_path
+        seasons = TeamRegistry.available(path)
+        assert(seasons), f'No TEAMyyyy files in {path}'
+        earlier = [year for year in seasons if year <= season]
+        # Seasons before the first file use the first file.
+        year = earlier[-1] if earlier else seasons[0]
+        with open(os.path.join(path, f'TEAM{year}'), 'r', newline='') as file:
+            rows = [row for row in csv.reader(file) if row]
+        return TeamRegistry(season, rows)
+
+    # Team name to team id.
+    def resolve(self, name):
+        key = name.casefold()
+        id = self.names.get(key)
+        if id:
+            return id
+        # Longest known suffix, e.g. 'Chicago White Sox' -> 'White Sox'
+        words = key.split(' ')
+        for i in range(1, len(words)):
+            id = self.names.get(' '.join(words[i:]))
+            if id:
+                self.names[key] = id
+                return id
+        print(f'ERROR: Couldnt find {name} in the TEAM{self.season} list.')
+        assert(False)
@@ -0,0 +1,61 @@
+import argparse
+import functools
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from browser import BrowserManager
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='BenchProfile',
+                   description='Compares page-ready latency and browser memory of the '
+                               'default and lean browser profiles on a local scores page fixture')
+
+    # Directory holding a saved copy of the scores page and its resources.
+    parser.add_argument('fixture')
+    parser.add_argument('--page', default='index.html')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--driver-path', default=None)
+
+    # Parse args
+    args = parser.parse_args()
+
+    # Serve the fixture directory
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=args.fixture)
+    handler.log_message = lambda *argv: None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{args.port}/{args.page}'
+
+    results = {}
+    for profile in ('default', 'lean'):
+        browser = BrowserManager(args.driver_path, standby=False, profile=profile)
+        latencies, rss = [], []
+        for _ in range(args.runs):
+            driver = browser.acquire()
+            # Page-ready: load event fired and the scores root is in the DOM.
+            start = time.monotonic()
+            driver.get(url)
+            driver.execute_script("return document.querySelector('#scores-schedule-root')")
+            latencies.append(time.monotonic() - start)
+            rss.append(browser.active.rss())
+            browser.close()
+        latencies.sort()
+        results[profile] = {
+            'runs': args.runs,
+            'ready_secs_mean': sum(latencies) / len(latencies),
+            'ready_secs_p50': latencies[len(latencies)//2],
+            'ready_secs_max': latencies[-1],
+            'rss_mean': sum(rss) / len(rss) if None not in rss else None,
+            'launch_secs_mean': browser.metrics()['mean_launch_secs']
+        }
+
+    server.shutdown()
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,290 @@
+import argparse
+import bs4 as bs
+import contextlib
+import datetime
+import json
+import os
+import platform
+import pytz
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from csvdumper import CSVDumper
+from extractor import ParsedGame, SoupExtractor
+from game import GameState
+from history import GameHistory
+from lines import LineGenerator
+from mysqldb import Database
+import mysqldb
+from replay import load, load_response
+from soup import SoupParser
+
+# Runs func repeat times, returns the timings in seconds.
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+# Runs func once under tracemalloc, returns the peak bytes allocated and the
+# bytes still allocated once it returns.
+def allocated(func):
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'peak_alloc_bytes': peak, 'retained_bytes': retained}
+
+def summarize(times, **extra):
+    summary = {
+        'n': len(times),
+        'mean_s': statistics.fmean(times),
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'max_s': max(times)
+    }
+    summary.update(extra)
+    return summary
+
+# Mean timing of each consecutive block of rows, to show how the cost of a
+# dump grows with the size of the file it's written to.
+def by_rows(times, block):
+    return {str(i+block): statistics.fmean(times[i:i+block]) for i in range(0, len(times), block)}
+
+# Game soups from a saved scores page, or from the last brew of a recording.
+def load_soups(path):
+    if path.endswith('.jsonl.gz'):
+        html = [data for _, kind, data in load(path) if kind == 'brew'][-1]
+        return [bs.BeautifulSoup(game, 'html.parser').div for game in html]
+    with open(path, 'r') as file:
+        soup = bs.BeautifulSoup(file.read(), 'html.parser')
+    return soup.find('main'
+                    ).find('div', {'id': 'scores-schedule-root'}
+                    ).find_all('div', {'data-test-mlb': 'singleGameContainer'})
+
+# Builds a live GameState with the given lines, for the dumper stages.
+def make_game(id, line_info):
+    game = GameState(id)
+    game.timestamp = datetime.datetime.now(pytz.timezone('US/Pacific'))
+    game.inning, game.is_bot, game.outs = 5, 1, 2
+    game.score = (3, 4)
+    game.runners = [1, 0, 1]
+    game.batter, game.pitcher = 'Aaron Judge', 'Logan Webb'
+    game.count = (2, 1)
+    game.line_info = line_info
+    return game
+
+# SQLite stand-in for a mysql.connector connection.
+# Translates the '%s' placeholders and the base column names of the Database
+# insert commands.
+class SQLiteConnection:
+    class Cursor:
+        def __init__(self, cursor):
+            self.cursor = cursor
+        def execute(self, cmd, vals):
+            self.cursor.execute(SQLiteConnection.translate(cmd),
+                                tuple(SQLiteConnection.adapt(v) for v in vals))
+        def executemany(self, cmd, vals):
+            self.cursor.executemany(SQLiteConnection.translate(cmd),
+                                    [tuple(SQLiteConnection.adapt(v) for v in row) for row in vals])
+        def fetchall(self):
+            return self.cursor.fetchall()
+
+    def translate(cmd):
+        return re.sub(r'\b([123]B)\b', r'"\1"', cmd.replace('%s', '?'))
+
+    # numpy scalars aren't sqlite types
+    def adapt(val):
+        return val.item() if hasattr(val, 'item') else val
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.commits = 0
+        self.connection.executescript('''
+            CREATE TABLE states (id INTEGER PRIMARY KEY, game_id TEXT, timestamp TEXT,
+                                 inning INT, is_bot INT, outs INT, away INT, home INT,
+                                 "1B" INT, "2B" INT, "3B" INT, batter TEXT, pitcher TEXT,
+                                 balls INT, strikes INT);
+            CREATE TABLE h2h (id INTEGER PRIMARY KEY, game_id TEXT, bookmaker TEXT,
+                              timestamp TEXT, last TEXT, H_price REAL, A_price REAL);
+            CREATE TABLE spreads (id INTEGER PRIMARY KEY, game_id TEXT, bookmaker TEXT,
+                                  timestamp TEXT, last TEXT, H_price REAL, H_point REAL,
+                                  A_price REAL, A_point REAL);
+            CREATE TABLE totals (id INTEGER PRIMARY KEY, game_id TEXT, bookmaker TEXT,
+                                 timestamp TEXT, last TEXT, U_price REAL, U_point REAL);
+        ''')
+
+    def cursor(self, **kwargs):
+        return SQLiteConnection.Cursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+        self.commits += 1
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self, **kwargs):
+        pass
+
+    # Pooled connections are returned to the pool, the stand-in is shared.
+    def close(self):
+        pass
+
+# Stand-in for a mysql.connector connection pool, on a single SQLite
+# connection to the database file.
+class SQLitePool:
+    def __init__(self, pool_name, pool_size, database, **kwargs):
+        self.pool_name = pool_name
+        self.connection = SQLiteConnection(database)
+
+    def get_connection(self):
+        return self.connection
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='Benchmark',
+                   description='Benchmarks the parse, line formatting and dump stages')
+
+    parser.add_argument('--html', default='./data/scores.html',
+                        help='saved scores page, or a replay recording, for the parse stages')
+    parser.add_argument('--response', default='./data/response.json')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=500,
+                        help='rows dumped per game file in the dumper stages')
+    parser.add_argument('--games', type=int, default=15,
+                        help='live games per iteration in the database iteration stage')
+    parser.add_argument('--out', default=None,
+                        help='append the results as a json line to this file')
+
+    # Parse args
+    args = parser.parse_args()
+
+    stages = {}
+
+    # Parse stages
+    if args.html:
+        soups = load_soups(args.html)
+        stages['soupparser.parse_live'] = summarize(
+            timeit(lambda: [SoupParser.parse_live(soup) for soup in soups], args.repeat),
+            games=len(soups))
+        stages['extractor.parse_live'] = summarize(
+            timeit(lambda: [SoupExtractor(soup).parse_live() for soup in soups], args.repeat),
+            games=len(soups))
+        stages['parsedgame.status'] = summarize(
+            timeit(lambda: [ParsedGame(soup).status for soup in soups], args.repeat),
+            games=len(soups))
+        # A fingerprint hit skips the parse, so it has to cost less than one.
+        # A miss parses off the walk the fingerprint already did.
+        def parse(record):
+            return (record.fingerprint, record.status,
+                    [getattr(record, field) for field in SoupParser.live_funcs])
+        parse_times = timeit(lambda: [parse(ParsedGame(soup)) for soup in soups], args.repeat)
+        hit_times = timeit(lambda: [ParsedGame(soup).fingerprint for soup in soups], args.repeat)
+        stages['parsedgame.miss'] = summarize(parse_times, games=len(soups))
+        stages['parsedgame.hit'] = summarize(
+            hit_times, games=len(soups),
+            hit_vs_miss=statistics.median(hit_times) / statistics.median(parse_times))
+
+    # Line formatting stage
+    response = load_response(args.response)
+    linegen = LineGenerator(None)
+    stages['lines.format_response'] = summarize(
+        timeit(lambda: linegen.format_response(response), args.repeat),
+        games=len(response), **allocated(lambda: linegen.format_response(response)))
+
+    # Game id stages
+    names = [game['home_team'] for game in response] + [game['away_team'] for game in response]
+    stages['game.get_team_id'] = summarize(
+        timeit(lambda: [GameState.get_team_id(name) for name in names], args.repeat),
+        names=len(names))
+    stages['game.get_id_prefix'] = summarize(
+        timeit(lambda: [GameState.get_id_prefix(name) for name in names], args.repeat),
+        names=len(names))
+
+    lines = linegen.format_response(response)
+    line_info = next(iter(lines.values()))[1]
+    block = max(args.rows // 5, 1)
+
+    # History stages, on a buffer of rows states.
+    history = GameHistory(args.rows)
+    game = make_game('BENCH0', line_info)
+    def append():
+        game.timestamp += datetime.timedelta(seconds=30)
+        history.append(game)
+    stages['history.append'] = summarize(timeit(append, args.rows),
+                                         columns=len(history.columns) + len(history.lines))
+    middle = game.timestamp - datetime.timedelta(seconds=15*args.rows)
+    stages['history.latest'] = summarize(timeit(lambda: history.latest(10), args.repeat), n=10)
+    stages['history.as_of'] = summarize(timeit(lambda: history.as_of(middle), args.repeat))
+    stages['history.movement'] = summarize(timeit(lambda: history.movement(middle), args.repeat),
+                                           bytes=history.nbytes())
+
+    # Dumper stages
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(tmp+'/states')
+        os.makedirs(tmp+'/lines')
+        dumper = CSVDumper(tmp+'/states', tmp+'/lines')
+        game = make_game('BENCH0', line_info)
+        state_times = timeit(lambda: dumper.dump_state(game), args.rows)
+        lines_times = timeit(lambda: dumper.dump_lines(game), args.rows)
+        stages['csvdumper.dump_state'] = summarize(state_times, by_rows=by_rows(state_times, block))
+        stages['csvdumper.dump_lines'] = summarize(lines_times, by_rows=by_rows(lines_times, block))
+
+        mysqldb.mysql.connector.pooling.MySQLConnectionPool = SQLitePool
+        # The connection banner would break the json output
+        with contextlib.redirect_stdout(sys.stderr):
+            database = Database(None, None, None, tmp+'/bench.db')
+        connection = database.pool.connection
+        # One dump per transaction
+        def commit(dump):
+            dump(game)
+            database.commit()
+        stages['database.dump_state'] = summarize(
+            timeit(lambda: commit(database.dump_state), args.rows), backend='sqlite')
+        stages['database.dump_lines'] = summarize(
+            timeit(lambda: commit(database.dump_lines), args.rows), backend='sqlite',
+            rows_per_dump=sum(connection.connection.execute(f'SELECT COUNT(*) FROM {table}'
+                                                            ).fetchone()[0]
+                              for table in ('h2h', 'spreads', 'totals')) // args.rows)
+        # Every live game's state and lines in one transaction, as the
+        # scraper commits an iteration.
+        games = [make_game(f'BENCH{i}', line_info) for i in range(args.games)]
+        def iteration():
+            for game in games:
+                database.dump_state(game)
+                database.dump_lines(game)
+            database.commit()
+        commits = connection.commits
+        stages['database.iteration'] = summarize(
+            timeit(iteration, args.repeat), backend='sqlite', games=args.games,
+            commits_per_iteration=(connection.commits - commits) / args.repeat,
+            rows_per_commit=database.metrics()['last_commit_rows'])
+
+    try:
+        head = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True).stdout.strip()
+    except Exception:
+        head = None
+    results = {
+        'commit': head,
+        'time': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'stages': stages
+    }
+    if args.out:
+        with open(args.out, 'a') as file:
+            file.write(json.dumps(results) + '\n')
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,92 @@
+import argparse
+import bs4 as bs
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from extractor import GameStatus, ParsedGame, SoupExtractor
+from soup import SoupParser
+
+# Status checks compared between the parsers.
+checks = ('is_warmup', 'is_live', 'is_pregame', 'is_delayed', 'is_suspended',
+          'is_final', 'is_postponed')
+
+# Game soups of a saved scores page, found as Soup.brew finds them.
+def load_soups(path, features):
+    with open(path, 'r') as file:
+        soup = bs.BeautifulSoup(file.read(), features)
+    return soup.find('main'
+                    ).find('div', {'id': 'scores-schedule-root'}
+                    ).find_all('div', {'data-test-mlb': 'singleGameContainer'})
+
+# Status of the soup as the Scraper classified it with SoupParser.
+def legacy_status(soup):
+    if SoupParser.is_warmup(soup):
+        return GameStatus.WARMUP
+    elif SoupParser.is_live(soup):
+        return GameStatus.LIVE
+    elif SoupParser.is_pregame(soup):
+        return GameStatus.PREGAME
+    elif SoupParser.is_final(soup):
+        return GameStatus.FINAL
+    elif SoupParser.is_postponed(soup):
+        return GameStatus.POSTPONED
+    elif SoupParser.is_suspended(soup):
+        return GameStatus.SUSPENDED
+    return GameStatus.UNKNOWN
+
+# Returns the fields where the parsers disagree on the soup, as
+# field -> [SoupParser value, SoupExtractor value].
+def compare(soup):
+    extractor = SoupExtractor(soup)
+    expected, actual = {}, {}
+    for parse in ('parse_pre', 'parse_live', 'parse_post'):
+        for key, value in getattr(SoupParser, parse)(soup).items():
+            expected[f'{parse}.{key}'] = value
+        for key, value in getattr(extractor, parse)().items():
+            actual[f'{parse}.{key}'] = value
+    for check in checks:
+        expected[check] = getattr(SoupParser, check)(soup)
+        actual[check] = getattr(extractor, check)()
+    if expected['is_pregame']:
+        expected['start_time'] = SoupParser.get_start_time(soup)
+        actual['start_time'] = extractor.get_start_time()
+    expected['status'] = legacy_status(soup)
+    actual['status'] = ParsedGame(soup).status
+    return {key: [repr(expected.get(key)), repr(actual.get(key))]
+            for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)}
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='ExtractorParity',
+                   description='Checks the SoupExtractor and ParsedGame against SoupParser '
+                               'on a saved scores page')
+    parser.add_argument('--html', default='./data/scores.html')
+    parser.add_argument('--features', default='html.parser',
+                        help='BeautifulSoup tree builder, e.g. lxml')
+
+    # Parse args
+    args = parser.parse_args()
+
+    soups = load_soups(args.html, args.features)
+    results = {'html': args.html, 'features': args.features, 'games': []}
+    failed = False
+    for soup in soups:
+        mismatches = compare(soup)
+        results['games'].append({'teams': SoupParser.get_teams(soup),
+                                 'status': ParsedGame(soup).status.value,
+                                 'mismatches': mismatches})
+        failed = failed or bool(mismatches)
+
+    # Every status the Scraper handles should show up in the page.
+    seen = set(game['status'] for game in results['games'])
+    results['missing_statuses'] = [status.value for status in GameStatus
+                                   if status is not GameStatus.UNKNOWN and not status.value in seen]
+    failed = failed or not soups or bool(results['missing_statuses'])
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
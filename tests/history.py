@@ -0,0 +1,70 @@
+import argparse
+import bs4 as bs
+import datetime
+import json
+import os
+import pytz
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from extractor import GameStatus, ParsedGame
+from game import GameState
+from history import GameHistory
+
+# Game records of a saved scores page, found as Soup.brew finds them.
+def load_records(path):
+    with open(path, 'r') as file:
+        soup = bs.BeautifulSoup(file.read(), 'html.parser')
+    return [ParsedGame(game) for game in soup.find('main'
+                    ).find('div', {'id': 'scores-schedule-root'}
+                    ).find_all('div', {'data-test-mlb': 'singleGameContainer'})]
+
+# State of the game as the history should hand it back.
+def expected_row(game):
+    return {'inning': game.inning, 'is_bot': game.is_bot, 'outs': game.outs,
+            'away': game.score[0], 'home': game.score[1],
+            '1B': game.runners[0], '2B': game.runners[1], '3B': game.runners[2],
+            'balls': game.count[0], 'strikes': game.count[1]}
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='History',
+                   description='Checks that the live games of a saved scores page are '
+                               'recorded and read back by the game history')
+    parser.add_argument('--html', default='./data/scores.html')
+    parser.add_argument('--capacity', type=int, default=2,
+                        help='states held per game, small so the buffer wraps')
+
+    # Parse args
+    args = parser.parse_args()
+
+    # GameState.update needs the outs, so containers without them are left out.
+    records = [record for record in load_records(args.html)
+               if record.status is GameStatus.LIVE and record.outs is not None]
+    start = datetime.datetime(2023, 6, 1, 19, 5, tzinfo=pytz.timezone('US/Pacific'))
+    results = {'html': args.html, 'games': []}
+    failed = not records
+    for i, record in enumerate(records):
+        game = GameState(f'GAME{i}')
+        game.history = GameHistory(args.capacity)
+        # One more state than the buffer holds, so the oldest is overwritten.
+        for n in range(args.capacity + 1):
+            game.update(start + datetime.timedelta(seconds=30*n), record, None)
+        row = game.history.latest(1)[0]
+        expected = expected_row(game)
+        mismatches = {key: [repr(value), repr(row[key])] for key, value in expected.items()
+                      if row[key] != value}
+        ok = (not mismatches and len(game.history) == args.capacity and
+              game.history.as_of(start) is None and row['timestamp'] == game.timestamp)
+        results['games'].append({'teams': record.teams, 'runners': record.runners,
+                                 'count': record.count, 'mismatches': mismatches, 'ok': ok})
+        failed = failed or not ok
+
+    # The page has a base without a fill, which must be recorded as missing runners.
+    results['missing_runners'] = sum(None in game['runners'] for game in results['games'])
+    failed = failed or not results['missing_runners']
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
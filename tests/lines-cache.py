@@ -0,0 +1,71 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from clock import VirtualClock
+from replay import ReplayLineGenerator, load_response
+
+# Lines of the game from a generator, at hours after its listed start.
+# Returns (lines of the first call, lines of a second call, generator)
+def lines_at(game, hours, prefixes, ttl, idle_ttl, scoped=False):
+    start = datetime.datetime.fromisoformat(game['commence_time'].replace('Z', '+00:00'))
+    clock = VirtualClock((start + datetime.timedelta(hours=hours)).timestamp())
+    linegen = ReplayLineGenerator([], clock, [game], ttl=ttl, idle_ttl=idle_ttl, scoped=scoped)
+    first = linegen.get_lines(prefixes)
+    clock.sleep(ttl / 2)
+    return first, linegen.get_lines(prefixes), linegen
+
+def count(lines, prefix):
+    snapshot = lines.get(prefix, (None, None))[1]
+    return None if snapshot is None else len(snapshot)
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='LinesCache',
+                   description='Checks that the cached lines of games the scraper has live '
+                               'are formatted past their listed game window')
+    parser.add_argument('--response', default='./data/response.json')
+    parser.add_argument('--hours', type=float, default=5.5,
+                        help='hours after the listed start, past the game window')
+    parser.add_argument('--ttl', type=int, default=60)
+    parser.add_argument('--idle-ttl', type=int, default=1800)
+
+    # Parse args
+    args = parser.parse_args()
+
+    game = load_response(args.response)[0]
+    prefix = next(iter(ReplayLineGenerator([], None, [game]).format_response([game])))
+
+    # Without the cache every game is formatted.
+    expected, _, _ = lines_at(game, args.hours, {prefix}, 0, 0)
+    results = {'game': prefix, 'hours': args.hours, 'expected_lines': count(expected, prefix),
+               'cases': {}}
+    failed = False
+    for scoped in (False, True):
+        # Live game past its window: formatted, and cached for ttl, not idle_ttl.
+        live, again, linegen = lines_at(game, args.hours, {prefix},
+                                        args.ttl, args.idle_ttl, scoped)
+        ttl = linegen.cache_ttl(linegen.clock.now(datetime.timezone.utc), {prefix})
+        # Not live: listed with its start time only, and cached for idle_ttl.
+        # Scoped, nothing is in scope so nothing is queried or cached.
+        idle, _, idle_linegen = lines_at(game, args.hours, set(),
+                                         args.ttl, args.idle_ttl, scoped)
+        idle_ttl = idle_linegen.cache_ttl(idle_linegen.clock.now(datetime.timezone.utc))
+        case = {'live_lines': count(live, prefix),
+                'live_cached_lines': count(again, prefix),
+                'live_cache_ttl': ttl,
+                'idle_lines': count(idle, prefix),
+                'idle_cache_ttl': idle_ttl}
+        ok = (case['live_lines'] == case['live_cached_lines'] == results['expected_lines'] and
+              ttl == args.ttl and case['idle_lines'] is None and
+              idle_ttl == (None if scoped else args.idle_ttl))
+        results['cases']['scoped' if scoped else 'full'] = dict(case, ok=ok)
+        failed = failed or not ok
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,140 @@
+import argparse
+import gzip
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from lines import LineGenerator
+from oddsclient import CircuitOpen, OddsClient
+from replay import load_response
+
+# Local stand-in for the odds api.
+# The server's mode picks how the odds endpoint answers:
+#   'ok'    - the response, gzipped if asked for,
+#   'flaky' - 503 for the first failures requests, then ok,
+#   'slow'  - sends the headers, then stalls past the client's read timeout,
+#   'down'  - 500 on every request.
+class StandIn(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mode = 'ok'
+    failures = 0
+    body = b''
+    connections = set()
+    requests = 0
+    stall = 2
+
+    def log_message(self, *argv):
+        pass
+
+    def do_GET(self):
+        StandIn.requests += 1
+        StandIn.connections.add(self.client_address)
+        if StandIn.mode == 'down' or (StandIn.mode == 'flaky' and StandIn.failures > 0):
+            StandIn.failures -= 1
+            self.send_response(503 if StandIn.mode == 'flaky' else 500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = StandIn.body
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('x-requests-remaining', '19000')
+        self.send_header('x-requests-used', '1000')
+        self.end_headers()
+        if StandIn.mode == 'slow':
+            self.wfile.write(body[:100])
+            self.wfile.flush()
+            time.sleep(StandIn.stall)
+        self.wfile.write(body)
+
+def check(results, name, ok, **extra):
+    results[name] = dict(ok=bool(ok), **extra)
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='OddsClient',
+                   description='Runs the odds api client against a local stand-in server')
+    parser.add_argument('--response', default='./data/response.json')
+    parser.add_argument('--port', type=int, default=8766)
+
+    # Parse args
+    args = parser.parse_args()
+
+    StandIn.body = json.dumps(load_response(args.response)).encode('utf-8')
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    sleeps = []
+    def client():
+        return OddsClient('key', base_url=f'http://127.0.0.1:{args.port}', timeout=(1, 0.5),
+                          retries=2, backoff=0.01, max_failures=2, cooldown=0.5,
+                          sleep=lambda secs: sleeps.append(secs) or time.sleep(secs))
+    results = {}
+
+    # Pooling and compression, streamed and not.
+    for stream in (False, True):
+        StandIn.mode, StandIn.connections = 'ok', set()
+        linegen = LineGenerator('key', client=client(), stream=stream)
+        lines = [linegen.get_lines() for _ in range(3)]
+        metrics = linegen.client.metrics()
+        check(results, f'pooled_compressed_stream_{stream}',
+              len(StandIn.connections) == 1 and metrics['wire_bytes'] < metrics['body_bytes']
+              and len(lines[0]) == 20 and metrics['requests'] == 3,
+              connections=len(StandIn.connections), **metrics)
+
+    # Retries with jittered backoff.
+    StandIn.mode, StandIn.failures = 'flaky', 2
+    del sleeps[:]
+    linegen = LineGenerator('key', client=client())
+    lines = linegen.get_lines()
+    metrics = linegen.client.metrics()
+    check(results, 'retry', len(lines) == 20 and metrics['retries'] == 2 and len(sleeps) == 2
+          and sleeps[0] <= 0.01 and sleeps[1] <= 0.02, sleeps=list(sleeps), **metrics)
+
+    # Read timeout on a stalled body, falls back to the last good lines.
+    StandIn.mode = 'ok'
+    linegen = LineGenerator('key', client=client(), stream=True)
+    good = linegen.get_lines()
+    StandIn.mode = 'slow'
+    start = time.monotonic()
+    lines = linegen.get_lines()
+    elapsed = time.monotonic() - start
+    check(results, 'timeout_fallback', lines is good and elapsed < StandIn.stall
+          and linegen.fallbacks == 1, elapsed=elapsed)
+
+    # Circuit breaker opens, fails fast, then half opens after the cooldown.
+    StandIn.mode = 'down'
+    linegen = LineGenerator('key', client=client())
+    linegen.last_good = good
+    before = StandIn.requests
+    lines = [linegen.get_lines() for _ in range(4)]
+    sent = StandIn.requests - before
+    metrics = linegen.client.metrics()
+    try:
+        linegen.client.get('/sports/baseball_mlb/odds', {})
+        rejected = False
+    except CircuitOpen:
+        rejected = True
+    time.sleep(0.6)
+    StandIn.mode = 'ok'
+    recovered = linegen.get_lines()
+    check(results, 'circuit_breaker',
+          all(l is good for l in lines) and rejected and sent == 6 and metrics['circuit_open']
+          and len(recovered) == 20 and not linegen.client.metrics()['circuit_open'],
+          sent=sent, fallbacks=linegen.fallbacks, **metrics)
+
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result['ok'] for result in results.values()) else 1)
@@ -0,0 +1,114 @@
+import argparse
+import functools
+import http.server
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from browser import BrowserManager
+from soup import Soup
+
+# Mutates the game containers of the page, as the scores page's own scripts
+# would. Called with the step name, returns the number of containers.
+# Steps it doesn't know leave the page as is.
+mutate_js = """
+    const root = document.querySelector('#scores-schedule-root');
+    const games = () => root.querySelectorAll('""" + Soup.game_selector + """');
+    const step = arguments[0];
+    if (step === 'changed') {
+        // Text, text node and attribute mutations
+        games()[0].querySelector('[data-mlb-test="inningNumberLabel"]').textContent = 'Bot 5';
+        games()[1].querySelector('[class*="StyledCountWrapper"]').firstChild.data = '1 - 0';
+        games()[7].querySelector('rect').setAttribute('fill', '#FFFFFF');
+    } else if (step === 'removed') {
+        window.__removed = games()[2];
+        window.__removed.remove();
+    } else if (step === 're-added') {
+        root.insertBefore(window.__removed, games()[2]);
+    } else if (step === 're-rendered') {
+        // A fresh node, as a framework re-render would insert.
+        const game = games()[3];
+        const fresh = game.cloneNode(true);
+        fresh.removeAttribute('data-scraper-idx');
+        fresh.querySelector('[data-mlb-test="inningNumberLabel"]').textContent = 'Top 1';
+        game.replaceWith(fresh);
+    } else if (step === 'added') {
+        const fresh = games()[9].cloneNode(true);
+        fresh.removeAttribute('data-scraper-idx');
+        fresh.querySelector('[data-mlb-test="gameStartTimesStateLabel"]').textContent = '9:40 PM ET';
+        root.insertBefore(fresh, games()[0]);
+    }
+    return games().length;
+"""
+
+# Steps, with the page positions of the containers that should be parsed again.
+# None means every container.
+steps = [
+    ('unchanged', []),
+    ('changed', [0, 1, 7]),
+    ('removed', []),
+    ('re-added', [2]),
+    ('re-rendered', [3]),
+    ('added', [0]),
+    ('reloaded', None)
+]
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='PushMode',
+                   description='Checks the push mode brews against pulling the whole page, '
+                               'as the containers of a local scores page fixture change')
+    parser.add_argument('--html', default='./data/scores.html')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--driver-path', default=None)
+    parser.add_argument('--profile', default='default')
+
+    # Parse args
+    args = parser.parse_args()
+
+    # Serve the fixture directory
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                directory=os.path.dirname(os.path.abspath(args.html)))
+    handler.log_message = lambda *argv: None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Soup.url = f'http://127.0.0.1:{args.port}/{os.path.basename(args.html)}'
+
+    soup = Soup(push=True, browser=BrowserManager(args.driver_path, standby=False,
+                                                  profile=args.profile))
+    records = soup.brew(parsed=True)
+    results = {'url': Soup.url, 'games': len(records), 'steps': {}}
+    failed = not records
+    for step, expected in steps:
+        if step == 'reloaded':
+            soup.driver.refresh()
+        games = soup.driver.execute_script(mutate_js, step)
+        previous = records
+        records = soup.brew(parsed=True)
+        # Unchanged containers keep their record, so any new record was parsed again.
+        reparsed = [i for i, record in enumerate(records)
+                    if not any(record is old for old in previous)]
+        pulled = soup.pull()
+        result = {
+            'games': len(records),
+            'reparsed': reparsed,
+            'expected_reparsed': expected,
+            'matches_pull': ([str(record.soup) for record in records] ==
+                             [str(record.soup) for record in pulled]),
+            'fingerprints_match_pull': ([record.fingerprint for record in records] ==
+                                        [record.fingerprint for record in pulled])
+        }
+        result['ok'] = (result['games'] == games and result['matches_pull'] and
+                        result['fingerprints_match_pull'] and
+                        reparsed == (expected if expected is not None else list(range(games))))
+        results['steps'][step] = result
+        failed = failed or not result['ok']
+
+    soup.close()
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+from lines import LineGenerator
+from replay import load_response
+
+# Splits the body into chunks of the given size, as iter_content would.
+def chunked(body, size):
+    return (body[i:i+size] for i in range(0, len(body), size))
+
+# Formats the games with a fresh generator, so no caches are shared.
+def format_games(games):
+    return LineGenerator(None).format_response(games)
+
+# Runs func under tracemalloc, returns its peak allocated bytes.
+def peak(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+if __name__ == '__main__':
+    # Define cli args
+    parser = argparse.ArgumentParser(
+                   prog='StreamParity',
+                   description='Checks the streamed odds response decoding against '
+                               'decoding the whole response')
+    parser.add_argument('--response', default='./data/response.json')
+    parser.add_argument('--copies', type=int, default=10,
+                        help='times the response is repeated, for the memory comparison')
+
+    # Parse args
+    args = parser.parse_args()
+
+    response = load_response(args.response)
+    body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+    expected = format_games(response)
+
+    # Decoded games and formatted lines must match for any chunking,
+    # including chunks that split multi-byte characters.
+    results = {'games': len(response), 'body_bytes': len(body), 'chunk_sizes': {}}
+    failed = False
+    for size in (1, 7, 1024, LineGenerator.chunk_size, len(body)):
+        games = list(LineGenerator.iter_games(chunked(body, size)))
+        formatted = format_games(LineGenerator.iter_games(chunked(body, size)))
+        ok = (games == response and formatted.keys() == expected.keys() and
+              all(formatted[prefix][0] == expected[prefix][0] and
+                  formatted[prefix][1].lines == expected[prefix][1].lines for prefix in expected))
+        results['chunk_sizes'][size] = ok
+        failed = failed or not ok
+
+    # Error responses are json objects, not arrays.
+    try:
+        list(LineGenerator.iter_games([b'{"message": "Usage quota has been reached"}']))
+        results['error_response'] = False
+        failed = True
+    except AssertionError:
+        results['error_response'] = True
+
+    # Peak memory of decoding then formatting the whole body vs streaming it.
+    big = json.dumps(response * args.copies).encode('utf-8')
+    results['copies'] = args.copies
+    results['whole_peak_bytes'] = peak(
+        lambda: format_games(json.loads(big)))
+    results['stream_peak_bytes'] = peak(
+        lambda: format_games(LineGenerator.iter_games(chunked(big, LineGenerator.chunk_size))))
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)